@@ -0,0 +1,181 @@
+import asyncio
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from typing import Any
+
+from django.core.cache import cache
+
+MISSING = object()
+
+
+@contextmanager
+def cache_lock(key: str, timeout: int = 30, blocking_timeout: float = 10, interval: float = 0.1):
+    """
+    Distributed lock built on the atomic ``cache.add`` of the default cache.
+
+    With the Redis cache backend the lock is shared by every gunicorn and Celery worker. The lock
+    expires after ``timeout`` seconds so a crashed holder can never block other workers for good,
+    and it is only released by the worker that acquired it.
+
+    Parameters:
+        key (str): The cache key of the lock.
+        timeout (int): Seconds after which the lock expires on its own.
+        blocking_timeout (float): Seconds to wait for the lock. Use 0 to try only once.
+        interval (float): Seconds to sleep between acquisition attempts.
+
+    Yields:
+        bool: Whether the lock was acquired.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + blocking_timeout
+    acquired = cache.add(key, token, timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(interval)
+        acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def get_or_set_single_flight(
+    key: str, producer: Callable[[], Any], timeout: int, lock_timeout: int = 30, wait_timeout: float = 10
+) -> Any:
+    """
+    Returns the cached value of ``key``, producing it with ``producer`` if it is missing.
+
+    Only one worker runs ``producer`` at a time; concurrent callers wait for the lock and then read the
+    value it stored. If the lock cannot be acquired within ``wait_timeout`` seconds the caller produces
+    the value itself rather than failing.
+
+    Parameters:
+        key (str): The cache key of the value.
+        producer (Callable): Computes the value on a cache miss.
+        timeout (int): Seconds to keep the produced value in the cache.
+        lock_timeout (int): Seconds after which the producer lock expires.
+        wait_timeout (float): Seconds to wait for another worker to produce the value.
+
+    Returns:
+        Any: The cached or freshly produced value.
+    """
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        return value
+
+    with cache_lock(f"{key}:lock", timeout=lock_timeout, blocking_timeout=wait_timeout):
+        value = cache.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        value = producer()
+        cache.set(key, value, timeout)
+        return value
+
+
+def coalesce(
+    key: str,
+    func: Callable[[], Any],
+    lock_timeout: int = 60,
+    wait_timeout: float = 30,
+    result_timeout: int = 5,
+    interval: float = 0.05,
+) -> Any:
+    """
+    Runs ``func`` once for all concurrent callers sharing ``key``, across every worker.
+
+    The first caller takes a cache lock, runs ``func`` and publishes its return value, or the exception it
+    raised, under a result key for ``result_timeout`` seconds. Callers arriving while the lock is held wait
+    for that result instead of running ``func`` themselves. If the holder disappears without a result the
+    next caller takes over, and a caller that waited ``wait_timeout`` seconds runs ``func`` on its own.
+
+    Parameters:
+        key (str): Identifies the call, e.g. a hash of the normalized request.
+        func (Callable): The call to coalesce. Its result and exceptions must be picklable.
+        lock_timeout (int): Seconds after which the lock of a crashed caller expires.
+        wait_timeout (float): Seconds to wait for another caller's result.
+        result_timeout (int): Seconds to keep the published result for late waiters.
+        interval (float): Seconds to sleep between polls.
+
+    Returns:
+        Any: The return value of ``func``.
+    """
+    lock_key, result_key = f"{key}:lock", f"{key}:result"
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, lock_timeout):
+            try:
+                return _run_and_publish(result_key, func, result_timeout)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        while cache.get(lock_key) is not None and time.monotonic() < deadline:
+            entry = cache.get(result_key)
+            if entry is not None:
+                return _unpack_result(entry)
+            time.sleep(interval)
+
+        entry = cache.get(result_key)
+        if entry is not None:
+            return _unpack_result(entry)
+    return func()
+
+
+async def acoalesce(
+    key: str,
+    func: Callable[[], Awaitable[Any]],
+    lock_timeout: int = 60,
+    wait_timeout: float = 30,
+    result_timeout: int = 5,
+    interval: float = 0.05,
+) -> Any:
+    """
+    Async counterpart of ``coalesce`` where ``func`` is a coroutine function.
+    """
+    lock_key, result_key = f"{key}:lock", f"{key}:result"
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        token = uuid.uuid4().hex
+        if await cache.aadd(lock_key, token, lock_timeout):
+            try:
+                try:
+                    value = await func()
+                except Exception as e:
+                    await cache.aset(result_key, (False, e), result_timeout)
+                    raise
+                await cache.aset(result_key, (True, value), result_timeout)
+                return value
+            finally:
+                if await cache.aget(lock_key) == token:
+                    await cache.adelete(lock_key)
+
+        while await cache.aget(lock_key) is not None and time.monotonic() < deadline:
+            entry = await cache.aget(result_key)
+            if entry is not None:
+                return _unpack_result(entry)
+            await asyncio.sleep(interval)
+
+        entry = await cache.aget(result_key)
+        if entry is not None:
+            return _unpack_result(entry)
+    return await func()
+
+
+def _run_and_publish(result_key: str, func: Callable[[], Any], result_timeout: int) -> Any:
+    try:
+        value = func()
+    except Exception as e:
+        cache.set(result_key, (False, e), result_timeout)
+        raise
+    cache.set(result_key, (True, value), result_timeout)
+    return value
+
+
+def _unpack_result(entry: tuple[bool, Any]) -> Any:
+    succeeded, value = entry
+    if not succeeded:
+        raise value
+    return value
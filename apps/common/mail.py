@@ -0,0 +1,66 @@
+import contextlib
+import threading
+import time
+from smtplib import SMTPException, SMTPServerDisconnected
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+
+class PooledMailConnection:
+    """
+    Keeps one open mail connection per worker thread and sends every message over it.
+
+    Django opens and closes a new SMTP/SSL connection for each ``send()``. Here the connection is opened
+    once, reused by the following messages and only reopened after ``EMAIL_CONNECTION_MAX_IDLE`` seconds
+    without traffic or when the server has dropped it.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection and time.monotonic() - self._local.last_used > settings.EMAIL_CONNECTION_MAX_IDLE:
+            self.close()
+            connection = None
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._local.connection = connection
+        return connection
+
+    def send_messages(self, messages: list[EmailMessage]) -> int:
+        """
+        Sends a batch of messages over the pooled connection.
+
+        Parameters:
+            messages (list[EmailMessage]): The messages to send.
+
+        Returns:
+            int: The number of messages sent.
+        """
+        try:
+            sent = self.get_connection().send_messages(messages)
+        except SMTPServerDisconnected:
+            # The server closed the idle connection, send the batch again over a new one
+            self.close()
+            sent = self.get_connection().send_messages(messages)
+        self._local.last_used = time.monotonic()
+        return sent
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is not None:
+            with contextlib.suppress(SMTPException, OSError):
+                connection.close()
+
+
+mail_connection = PooledMailConnection()
+
+
+@worker_process_shutdown.connect
+def close_mail_connection(**kwargs):
+    mail_connection.close()
@@ -2,6 +2,7 @@ from django.db import connection
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 
+from apps.ensurance.quotes import green_card_quote_cache, medical_tariff_cache, rca_quote_cache
 from apps.ensurance.rca import RcaExportServiceClient
 
 
@@ -47,4 +48,11 @@ class HealthCheckView(GenericAPIView):
         except Exception:  # noqa BLE001
             data["rca"] = "error"
 
+        # Quote cache counters
+        data["quote_cache"] = {
+            "rca": rca_quote_cache.get_stats(),
+            "green_card": green_card_quote_cache.get_stats(),
+            "medical": medical_tariff_cache.get_stats(),
+        }
+
         return Response(data)
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
 
-from apps.ensurance.models import File, MedicalInsuranceCompany, RCACompany
+from apps.ensurance.claims import release_claim
+from apps.ensurance.constants import PaymentClaimStatus
+from apps.ensurance.models import File, FileEmail, MedicalInsuranceCompany, PaymentClaim, RCACompany
 
 
 @admin.register(File)
@@ -26,3 +29,28 @@ class MedicalInsuranceCompanyAdmin(admin.ModelAdmin):
     search_fields = ("name", "idno")
     list_filter = ("is_active", "is_public")
     fields = ("name", "idno", "is_active", "is_public", "logo")
+
+
+@admin.register(PaymentClaim)
+class PaymentClaimAdmin(admin.ModelAdmin):
+    list_display = ("id", "type", "status", "external_id", "created_at", "updated_at")
+    search_fields = ("external_id",)
+    list_filter = ("type", "status")
+    readonly_fields = ("type", "status", "qr_code", "maib_payment", "external_id", "error", "created_at", "updated_at")
+    actions = ["release_payments"]
+
+    @admin.action(description=_("Release the payment of the claims in review"))
+    def release_payments(self, request, queryset):
+        released = sum(
+            release_claim(claim, "Released after review.")
+            for claim in queryset.filter(status=PaymentClaimStatus.REVIEW)
+        )
+        self.message_user(request, _("%(count)d payments released.") % {"count": released})
+
+
+@admin.register(FileEmail)
+class FileEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "external_id", "email", "status", "attempts", "next_attempt_at", "created_at")
+    search_fields = ("external_id", "email")
+    list_filter = ("status", "link")
+    readonly_fields = ("external_id", "contract_type", "email", "link", "attempts", "error", "created_at", "updated_at")
@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from zeep.exceptions import Fault
+
+from apps.ensurance.constants import PaymentClaimStatus
+from apps.ensurance.models import PaymentClaim
+from apps.payment.models import MaibPayment, QrCode
+
+
+def claim_payment(
+    file_type: str, qr_code: QrCode | None = None, maib_payment: MaibPayment | None = None
+) -> PaymentClaim:
+    """
+    Marks a payment as used and records the claim in one short transaction.
+
+    The payment row is flipped with a conditional ``UPDATE``, so two concurrent saves cannot use the same
+    payment and no lock is held while the document is saved upstream.
+
+    Parameters:
+        file_type (str): The ``FileTypes`` of the document being saved.
+        qr_code (QrCode | None): The paid QR code.
+        maib_payment (MaibPayment | None): The successful MAIB payment.
+
+    Returns:
+        PaymentClaim: The claim, whose ``created_at`` is the payment date of the document.
+
+    Raises:
+        ValidationError: If the payment has already been used.
+    """
+    payment = qr_code or maib_payment
+    with transaction.atomic():
+        claimed = (
+            type(payment).objects.filter(pk=payment.pk, is_used=False).update(is_used=True, updated_at=timezone.now())
+        )
+        if not claimed:
+            raise ValidationError({"detail": "The payment has already been used."})
+        return PaymentClaim.objects.create(type=file_type, qr_code=qr_code, maib_payment=maib_payment)
+
+
+def complete_claim(claim: PaymentClaim, external_id) -> None:
+    claim.status = PaymentClaimStatus.SAVED
+    claim.external_id = external_id
+    claim.save(update_fields=["status", "external_id", "updated_at"])
+
+
+def flag_claim(claim: PaymentClaim, error: Exception | str) -> bool:
+    """
+    Moves a pending claim to manual review, keeping its payment used.
+
+    Used when it is unknown whether the document was saved upstream, e.g. when the worker died during the
+    save: releasing the payment could let it pay for a second document.
+
+    Returns:
+        bool: ``False`` if the claim was no longer pending and has been left untouched.
+    """
+    return bool(
+        PaymentClaim.objects.filter(pk=claim.pk, status=PaymentClaimStatus.CLAIMED).update(
+            status=PaymentClaimStatus.REVIEW, error=str(error), updated_at=timezone.now()
+        )
+    )
+
+
+def release_claim(claim: PaymentClaim, error: Exception | str | None = None) -> bool:
+    """
+    Compensates a claim whose document could not be saved by making its payment usable again.
+
+    Only pending claims, or claims in review once it has been checked that nothing was saved upstream, can
+    be released.
+
+    Parameters:
+        claim (PaymentClaim): The claim to release.
+        error (Exception | str | None): The reason of the release, kept on the claim.
+
+    Returns:
+        bool: ``False`` if the claim was no longer pending and has been left untouched.
+    """
+    with transaction.atomic():
+        released = PaymentClaim.objects.filter(
+            pk=claim.pk, status__in=[PaymentClaimStatus.CLAIMED, PaymentClaimStatus.REVIEW]
+        ).update(status=PaymentClaimStatus.RELEASED, error=str(error) if error else None, updated_at=timezone.now())
+        if not released:
+            return False
+        payment_model = QrCode if claim.qr_code_id else MaibPayment
+        payment_model.objects.filter(pk=claim.qr_code_id or claim.maib_payment_id).update(
+            is_used=False, updated_at=timezone.now()
+        )
+    claim.refresh_from_db()
+    return True
+
+
+def is_rejection(error: Exception) -> bool:
+    """
+    Returns whether a failed save was definitively rejected by the upstream service, so nothing was saved.
+
+    A validation error, or a SOAP fault returned by the service, is a rejection. Timeouts, connection errors
+    and server errors are not, since the document may have been saved before the response was lost.
+    """
+    return isinstance(error, (ValidationError, Fault)) or isinstance(error.__cause__, Fault)
+
+
+def settle_failed_claim(claim: PaymentClaim, error: Exception) -> None:
+    """
+    Releases the claim of a save rejected by the upstream service, and moves any other failed save to manual
+    review, where ``recover_payment_claims`` or an operator can check whether the document exists.
+    """
+    if is_rejection(error):
+        release_claim(claim, error)
+    else:
+        flag_claim(claim, error)
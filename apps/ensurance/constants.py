@@ -76,6 +76,31 @@ class ContractType(models.TextChoices):
     CV = "CV", _("CV")
 
 
+class DocumentStatus(models.TextChoices):
+    PENDING = "pending", _("Pending")
+    PROCESSING = "processing", _("Processing")
+    READY = "ready", _("Ready")
+    FAILED = "failed", _("Failed")
+
+
+class DeliveryModes(models.TextChoices):
+    STREAM = "stream", _("Stream")
+    REDIRECT = "redirect", _("Redirect")
+
+
+class EmailStatus(models.TextChoices):
+    PENDING = "pending", _("Pending")
+    SENT = "sent", _("Sent")
+    FAILED = "failed", _("Failed")
+
+
+class PaymentClaimStatus(models.TextChoices):
+    CLAIMED = "claimed", _("Claimed")
+    SAVED = "saved", _("Saved")
+    RELEASED = "released", _("Released")
+    REVIEW = "review", _("Needs review")
+
+
 class FileTypes(models.TextChoices):
     RCA = "RCA", _("RCA")
     GREEN_CARD = "GreenCard", _("Green Card")
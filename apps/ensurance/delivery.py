@@ -0,0 +1,203 @@
+import io
+import re
+import time
+import zipfile
+from collections.abc import Iterable, Iterator
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import http_date
+
+from apps.ensurance.constants import DeliveryModes
+from apps.ensurance.models import File
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single byte range of a ``Range`` header.
+
+    Parameters:
+        header (str | None): The value of the ``Range`` header.
+        size (int): The size of the object.
+
+    Returns:
+        tuple[int, int] | None: The first and last byte of the range, ``None`` when the header is missing
+            or not a single byte range, in which case the whole object is served.
+
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(" ", "")) if header else None
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range, e.g. "bytes=-500" for the last 500 bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise ValueError("Range Not Satisfiable")
+    return start, end
+
+
+def iter_object(storage, name: str, offset: int = 0, length: int = 0):
+    """
+    Yields the content of a MinIO object in chunks of ``CHUNK_SIZE`` bytes.
+    """
+    response = storage.client.get_object(storage.bucket, name, offset=offset, length=length)
+    try:
+        yield from response.stream(CHUNK_SIZE)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def serve_file(request, file: File, content_type: str = "application/pdf") -> HttpResponse:
+    """
+    Delivers a stored file without buffering it in the worker, see ``serve_object``.
+    """
+    return serve_object(request, file.file.storage, file.file.name, file.name, content_type)
+
+
+def serve_object(
+    request, storage, name: str, filename: str | None = None, content_type: str = "application/pdf"
+) -> HttpResponse:
+    """
+    Delivers a MinIO object without buffering it in the worker.
+
+    With ``DOCUMENT_DELIVERY_MODE`` set to ``redirect`` the client is redirected to a presigned MinIO URL
+    valid for ``DOCUMENT_URL_EXPIRY`` seconds. Otherwise the object is streamed from MinIO in chunks,
+    honouring ``If-None-Match`` and single ``Range`` requests.
+
+    Parameters:
+        request (Request): The HTTP request asking for the file.
+        storage (MinioBackend): The storage holding the object.
+        name (str): The name of the object.
+        filename (str | None): The file name sent to the client. Defaults to the last part of ``name``.
+        content_type (str): The content type of the response. Defaults to ``application/pdf``.
+
+    Returns:
+        HttpResponse: A 200, 206, 304, 302 or 416 response.
+
+    Raises:
+        Http404: If the object does not exist in the storage.
+    """
+    # The MinIO backend returns a falsy value instead of raising for a missing object
+    stat = storage.stat(name)
+    if not stat:
+        raise Http404("File not found.")
+    etag = f'"{stat.etag}"'
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    if settings.DOCUMENT_DELIVERY_MODE == DeliveryModes.REDIRECT:
+        url = storage.client_external.presigned_get_object(
+            storage.bucket, name, expires=timedelta(seconds=settings.DOCUMENT_URL_EXPIRY)
+        )
+        return HttpResponseRedirect(url)
+
+    size = stat.size
+    # Serve the whole file when If-Range does not match the current version
+    if_range = request.headers.get("If-Range")
+    range_header = request.headers.get("Range") if not if_range or if_range == etag else None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_object(storage, name, offset=start, length=end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        response = StreamingHttpResponse(iter_object(storage, name), content_type=content_type)
+        response["Content-Length"] = size
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = f'inline; filename="{filename or name.split("/")[-1]}"'
+    if stat.last_modified:
+        response["Last-Modified"] = http_date(stat.last_modified.timestamp())
+    return response
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable file object collecting the bytes written by ``zipfile`` until they are drained.
+
+    As the stream is not seekable, ``zipfile`` writes the sizes and CRC of every member in a data
+    descriptor after its content instead of seeking back to its header.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        yield from chunks
+
+
+def iter_zip_archive(files: Iterable[File]) -> Iterator[bytes]:
+    """
+    Yields a ZIP archive of stored files, built on the fly while the objects are streamed from MinIO.
+
+    Only one chunk of one object is held in memory at a time, whatever the size of the archive. The PDFs are
+    already compressed, so they are stored without compression.
+
+    Parameters:
+        files (Iterable[File]): The files to put in the archive.
+
+    Yields:
+        bytes: The next bytes of the archive.
+    """
+    stream = ZipStream()
+    names = set()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for file in files:
+            name = file.name or file.file.name.split("/")[-1]
+            # Keep the names unique inside the archive
+            if name in names:
+                name = f"{file.external_id}_{name}"
+            names.add(name)
+
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            with archive.open(info, mode="w", force_zip64=True) as member:
+                for chunk in iter_object(file.file.storage, file.file.name):
+                    member.write(chunk)
+                    yield from stream.drain()
+            yield from stream.drain()
+    yield from stream.drain()
+
+
+def serve_archive(files: Iterable[File], filename: str = "documents.zip") -> StreamingHttpResponse:
+    response = StreamingHttpResponse(iter_zip_archive(files), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
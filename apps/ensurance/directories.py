@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from apps.common.cache import cache_lock
+from apps.ensurance.donaris import MedicinaAPI
+
+DIRECTORIES_KEY = "donaris:directories"
+
+
+class DirectoriesUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The Donaris directories could not be fetched."
+    default_code = "directories_unavailable"
+
+
+def refresh_directories() -> dict:
+    """
+    Fetches the Donaris directories and stores them as the new snapshot.
+
+    Directories that could not be fetched keep their previous value, so a partial outage of Donaris
+    never empties the snapshot.
+
+    Returns:
+        dict: The new snapshot, see ``get_directories_snapshot``.
+
+    Raises:
+        DirectoriesUnavailable: If no directory could be fetched. The snapshot is then left untouched.
+    """
+    directories = MedicinaAPI().get_all_directories()
+    if not directories:
+        # Keep the previous snapshot stale, or none at all, so the next request tries again
+        raise DirectoriesUnavailable()
+    previous = cache.get(DIRECTORIES_KEY)
+    if previous:
+        directories = {**previous["data"], **directories}
+    snapshot = {"data": directories, "fetched_at": time.time()}
+    cache.set(DIRECTORIES_KEY, snapshot, timeout=None)
+    # Lets the in-process indexes check for a new snapshot without loading it
+    cache.set(f"{DIRECTORIES_KEY}:fetched_at", snapshot["fetched_at"], timeout=None)
+    return snapshot
+
+
+def schedule_refresh(fetched_at: float) -> None:
+    """
+    Schedules one Celery refresh of the directories when the snapshot is older than ``DONARIS_DIRECTORIES_TTL``.
+    """
+    if time.time() - fetched_at > settings.DONARIS_DIRECTORIES_TTL and cache.add(
+        f"{DIRECTORIES_KEY}:refreshing", True, timeout=5 * 60
+    ):
+        from apps.ensurance.tasks import refresh_medicina_directories
+
+        refresh_medicina_directories.delay()
+
+
+def get_directories_snapshot() -> dict:
+    """
+    Returns the snapshot of the Donaris directories, served stale-while-revalidate.
+
+    A stale snapshot (older than ``DONARIS_DIRECTORIES_TTL``) is returned as is while one Celery refresh is
+    scheduled. Only when there is no snapshot at all are the directories fetched in the request, by a
+    single worker at a time.
+
+    Returns:
+        dict: The directories by name under ``data`` and the time they were fetched at under ``fetched_at``.
+    """
+    snapshot = cache.get(DIRECTORIES_KEY)
+    if snapshot is None:
+        with cache_lock(f"{DIRECTORIES_KEY}:lock", timeout=60, blocking_timeout=60):
+            snapshot = cache.get(DIRECTORIES_KEY)
+            if snapshot is None:
+                return refresh_directories()
+
+    schedule_refresh(snapshot["fetched_at"])
+    return snapshot
+
+
+def get_directories() -> dict:
+    """
+    Returns the Donaris directories from the snapshot, see ``get_directories_snapshot``.
+
+    Returns:
+        dict: The directories by name.
+    """
+    return get_directories_snapshot()["data"]
@@ -0,0 +1,188 @@
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+
+from apps.ensurance.directories import DIRECTORIES_KEY, get_directories_snapshot, schedule_refresh
+
+# Keys of the directories in the snapshot, as returned by spravociniki_goroda, spravociniki_strani
+# and regioni_i_strani
+CITIES_KEY = "goroda"
+COUNTRIES_KEY = "strani"
+REGIONS_KEY = "regioni"
+
+# Donaris does not document the fields of the directory rows, the first matching field is used
+UIN_FIELDS = ("UIN", "Uin", "uin", "Kod", "kod", "Cod", "cod")
+NAME_FIELDS = ("Naimenovanie", "naimenovanie", "Denumire", "denumire", "Name", "name", "Nume", "nume")
+REGION_FIELDS = ("RegiuniUIN", "RegionUIN", "RegiuneUIN", "RegioniUIN", "Regiuni", "Region", "region")
+
+MIN_TRIGRAM_SCORE = 0.5
+
+
+def normalize(value: str) -> str:
+    """
+    Lowercases a name and strips its diacritics, so that "Chișinău" is found by "chisinau".
+    """
+    value = unicodedata.normalize("NFKD", str(value).casefold())
+    return "".join(char for char in value if not unicodedata.combining(char)).strip()
+
+
+def trigrams(value: str) -> set[str]:
+    value = f"  {value} "
+    return {value[i : i + 3] for i in range(len(value) - 2)}
+
+
+def get_field(row: dict, candidates: tuple[str, ...], contains: str | None = None):
+    """
+    Returns the value of the first candidate field present in the row, falling back to the first field
+    whose name contains ``contains``.
+    """
+    for name in candidates:
+        if row.get(name) not in (None, ""):
+            return row[name]
+    if contains:
+        for name, value in row.items():
+            if contains in name.lower() and value not in (None, ""):
+                return value
+    return None
+
+
+@dataclass
+class DirectoryEntry:
+    uin: str
+    name: str
+    kind: str
+    region_uin: str | None = None
+
+
+@dataclass
+class DirectoryIndex:
+    """
+    In-process index over the city and country directories of Donaris.
+
+    Names are searched by prefix (of the whole name or of any of its words) through a sorted list, and by
+    trigram similarity for typos. Regions are looked up by city or country UIN in a dictionary.
+    """
+
+    fetched_at: float | None = None
+    entries: list[DirectoryEntry] = field(default_factory=list)
+    regions: dict[str, str] = field(default_factory=dict)
+    prefixes: list[tuple[str, int]] = field(default_factory=list)
+    trigrams: dict[str, set[int]] = field(default_factory=lambda: defaultdict(set))
+
+    @classmethod
+    def build(cls, directories: dict, fetched_at: float | None = None) -> "DirectoryIndex":
+        index = cls(fetched_at=fetched_at)
+
+        for row in directories.get(REGIONS_KEY) or []:
+            region = get_field(row, REGION_FIELDS, contains="regi")
+            if region is None:
+                continue
+            # The remaining UIN fields of the row are the city or the country of the region
+            for name, value in row.items():
+                if value not in (None, "") and value != region and ("uin" in name.lower() or "kod" in name.lower()):
+                    index.regions[str(value)] = str(region)
+
+        for kind, key in (("city", CITIES_KEY), ("country", COUNTRIES_KEY)):
+            for row in directories.get(key) or []:
+                uin = get_field(row, UIN_FIELDS, contains="uin")
+                name = get_field(row, NAME_FIELDS)
+                if uin is None or name is None:
+                    continue
+                region = get_field(row, REGION_FIELDS) or index.regions.get(str(uin))
+                index.add(DirectoryEntry(str(uin), str(name), kind, str(region) if region else None))
+
+        index.prefixes.sort()
+        return index
+
+    def add(self, entry: DirectoryEntry) -> None:
+        position = len(self.entries)
+        self.entries.append(entry)
+        if entry.region_uin:
+            self.regions.setdefault(entry.uin, entry.region_uin)
+
+        name = normalize(entry.name)
+        words = {name, *name.replace("-", " ").split()}
+        self.prefixes.extend((word, position) for word in words)
+        for trigram in trigrams(name):
+            self.trigrams[trigram].add(position)
+
+    def get_region(self, uin: str) -> str | None:
+        return self.regions.get(str(uin))
+
+    def search(self, query: str, kind: str | None = None, limit: int = 10) -> list[DirectoryEntry]:
+        """
+        Returns the entries matching a query, prefix matches first, then the closest trigram matches.
+
+        Parameters:
+            query (str): The text typed by the user.
+            kind (str | None): ``city`` or ``country`` to search a single directory.
+            limit (int): The maximum number of entries returned.
+
+        Returns:
+            list[DirectoryEntry]: The matching entries.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        matches = []
+        seen = set()
+        start = bisect.bisect_left(self.prefixes, (query, -1))
+        for word, position in self.prefixes[start:]:
+            if not word.startswith(query):
+                break
+            if position not in seen:
+                seen.add(position)
+                matches.append(position)
+        matches.sort(
+            key=lambda position: (normalize(self.entries[position].name) != query, self.entries[position].name)
+        )
+
+        if len(query) >= 3:
+            query_trigrams = trigrams(query)
+            scores = defaultdict(int)
+            for trigram in query_trigrams:
+                for position in self.trigrams.get(trigram, ()):
+                    if position not in seen:
+                        scores[position] += 1
+            similar = [
+                position for position, score in scores.items() if score / len(query_trigrams) >= MIN_TRIGRAM_SCORE
+            ]
+            matches.extend(sorted(similar, key=lambda position: (-scores[position], self.entries[position].name)))
+
+        entries = (self.entries[position] for position in matches)
+        return [entry for entry in entries if kind is None or entry.kind == kind][:limit]
+
+
+_index = DirectoryIndex()
+_index_lock = threading.Lock()
+
+
+def get_directory_index() -> DirectoryIndex:
+    """
+    Returns the index of the current directories snapshot, rebuilt only when a new snapshot is stored.
+
+    Only the fetch time of the snapshot is read from the cache on each call; the snapshot itself is loaded
+    when the index has to be rebuilt.
+    """
+    global _index
+    fetched_at = cache.get(f"{DIRECTORIES_KEY}:fetched_at")
+    if fetched_at is not None and fetched_at == _index.fetched_at:
+        schedule_refresh(fetched_at)
+        return _index
+
+    with _index_lock:
+        if fetched_at is None or fetched_at != _index.fetched_at:
+            snapshot = get_directories_snapshot()
+            if fetched_at is None:
+                # The key can be missing after an eviction or for a snapshot stored before it existed. Restore
+                # it from the snapshot so the following calls do not rebuild the index again; ``add`` keeps
+                # the key of a newer snapshot stored in the meantime.
+                cache.add(f"{DIRECTORIES_KEY}:fetched_at", snapshot["fetched_at"], timeout=None)
+            if snapshot["fetched_at"] != _index.fetched_at:
+                _index = DirectoryIndex.build(snapshot["data"], snapshot["fetched_at"])
+    return _index
@@ -0,0 +1,148 @@
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from apps.ensurance.constants import DocumentStatus
+from apps.ensurance.models import File
+from apps.ensurance.rca import RcaExportServiceClient
+
+
+def get_document_status_key(document_id, contract_type: str) -> str:
+    return f"rca:document-status:{contract_type}:{document_id}"
+
+
+def get_document_status(document_id, contract_type: str) -> str | None:
+    """
+    Returns the build status of an RCA or Green Card document.
+
+    Parameters:
+        document_id: The ``DocumentId`` returned by BNM.
+        contract_type (str): The ``ContractType`` of the document.
+
+    Returns:
+        str | None: ``DocumentStatus.READY`` when the merged file is stored, the status of the build
+            otherwise, or ``None`` when no build was requested.
+    """
+    if File.objects.filter(external_id=document_id).exists():
+        return DocumentStatus.READY
+    return cache.get(get_document_status_key(document_id, contract_type))
+
+
+def set_document_status(document_id, contract_type: str, document_status: str) -> None:
+    cache.set(
+        get_document_status_key(document_id, contract_type), document_status, timeout=settings.RCA_DOCUMENT_STATUS_TTL
+    )
+
+
+def enqueue_document(document_id, contract_type: str) -> str:
+    """
+    Schedules the build of the merged document once the current transaction is committed.
+
+    Parameters:
+        document_id: The ``DocumentId`` returned by BNM.
+        contract_type (str): The ``ContractType`` of the document.
+
+    Returns:
+        str: The status of the document, ``DocumentStatus.PENDING``.
+    """
+    from apps.ensurance.tasks import download_and_merge_documents
+
+    set_document_status(document_id, contract_type, DocumentStatus.PENDING)
+    transaction.on_commit(lambda: download_and_merge_documents.delay(document_id, contract_type))
+    return DocumentStatus.PENDING
+
+
+def wait_for_document(document_id, timeout: float | None = None, interval: float = 0.5) -> File | None:
+    """
+    Waits for the merged document to be stored by the Celery task.
+
+    Parameters:
+        document_id: The ``DocumentId`` returned by BNM.
+        timeout (float | None): Seconds to wait, ``RCA_DOCUMENT_WAIT_TIMEOUT`` by default.
+        interval (float): Seconds between two lookups.
+
+    Returns:
+        File | None: The stored file, or ``None`` if it is not ready before the timeout.
+    """
+    deadline = time.monotonic() + (settings.RCA_DOCUMENT_WAIT_TIMEOUT if timeout is None else timeout)
+    while True:
+        file = File.objects.filter(external_id=document_id).first()
+        if file or time.monotonic() >= deadline:
+            return file
+        time.sleep(interval)
+
+
+def get_document_part_storage():
+    return File._meta.get_field("file").storage
+
+
+def get_document_part_name(document_id, contract_type: str, document_type: str) -> str:
+    return f"document-parts/{contract_type}/{document_id}/{document_type}.pdf"
+
+
+def store_document_part(document_id, contract_type: str, document_type: str) -> bytes:
+    """
+    Downloads one part of a document with ``GetFile`` and stores it in MinIO.
+
+    Parameters:
+        document_id: The ``DocumentId`` returned by BNM.
+        contract_type (str): The ``ContractType`` of the document.
+        document_type (str): The ``DocumentType`` of the part.
+
+    Returns:
+        bytes: The content of the part.
+    """
+    response = RcaExportServiceClient().get_file(
+        DocumentId=document_id,
+        DocumentType=document_type,
+        ContractType=contract_type,
+    )
+    get_document_part_storage().save(
+        get_document_part_name(document_id, contract_type, document_type), ContentFile(response.FileContent)
+    )
+    return response.FileContent
+
+
+def get_document_part(document_id, contract_type: str, document_type: str) -> bytes:
+    """
+    Returns one part of a document, downloading it only if it is not stored yet.
+
+    Parameters:
+        document_id: The ``DocumentId`` returned by BNM.
+        contract_type (str): The ``ContractType`` of the document.
+        document_type (str): The ``DocumentType`` of the part.
+
+    Returns:
+        bytes: The content of the part.
+    """
+    storage = get_document_part_storage()
+    name = get_document_part_name(document_id, contract_type, document_type)
+    if storage.exists(name):
+        with storage.open(name) as part:
+            return part.read()
+    return store_document_part(document_id, contract_type, document_type)
+
+
+FILE_LINK_SALT = "apps.ensurance.file-link"
+
+
+def get_signed_file_url(external_id) -> str:
+    """
+    Returns a download link of a stored file, valid for ``EMAIL_FILE_LINK_MAX_AGE`` seconds.
+    """
+    token = signing.TimestampSigner(salt=FILE_LINK_SALT).sign(str(external_id))
+    return f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/signed-file/{token}/"
+
+
+def unsign_file_token(token: str) -> str:
+    """
+    Returns the ``external_id`` of a signed download link.
+
+    Raises:
+        signing.BadSignature: If the token was tampered with or has expired.
+    """
+    return signing.TimestampSigner(salt=FILE_LINK_SALT).unsign(token, max_age=settings.EMAIL_FILE_LINK_MAX_AGE)
@@ -1,8 +1,20 @@
 import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from django.conf import settings
-from rest_framework.exceptions import ValidationError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+
+class DonarisUnavailable(APIException):
+    """
+    Raised for a Donaris server error, so it is not mistaken for a rejection of the request data.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The Donaris service is unavailable."
+    default_code = "donaris_unavailable"
 
 
 class MedicinaAPI:
@@ -54,15 +66,15 @@ class MedicinaAPI:
         :param endpoint: API endpoint (e.g., "medicina_calcul_tarif").
         :param json_data: (Optional) Dictionary to send as JSON.
         :return: Parsed JSON response.
-        :raises: requests.HTTPError if an error occurs.
+        :raises: ValidationError if Donaris rejected the request, DonarisUnavailable on a server error.
         """
         url = self.base_url + self.api_path + endpoint.lstrip("/")
         response = self.session.post(url, json=json_data)
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
-            if response.status_code == 500:
-                raise ValidationError(f"Server Error: {response.text}") from e
+            if response.status_code >= 500:
+                raise DonarisUnavailable(f"Server Error: {response.text}") from e
             else:
                 raise ValidationError(response.json()) from e
         return response.json()
@@ -135,7 +147,9 @@ class MedicinaAPI:
 
     def get_all_directories(self):
         """
-        Retrieve all справочники (directories) synchronously.
+        Retrieve all справочники (directories) concurrently.
+
+        Directories that fail to load are left out of the result.
 
         :return: A dictionary with the following keys:
             - medicina_producti
@@ -158,9 +172,11 @@ class MedicinaAPI:
             "regioni_i_strani": self.get_regioni_i_strani,
         }
         results = {}
-        for key, func in endpoints.items():
-            with contextlib.suppress(Exception):
-                results.update(func())
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            futures = [executor.submit(func) for func in endpoints.values()]
+            for future in futures:
+                with contextlib.suppress(Exception):
+                    results.update(future.result())
         return results
 
     # --- POST methods for operations ---
@@ -1,14 +1,15 @@
-from io import BytesIO
+from django.templatetags.static import static
 
-import fitz
+from apps.ensurance.models import RCACompany
+from apps.ensurance.pdf import pdf_stamper
 
 
 def insert_image_into_pdf(data: bytes, x: int = 380, y: int = 680, w: int = 200, h: int = 200) -> bytes:
     """
     Insert an image onto the last page of a PDF at a specified location and size.
 
-    This function takes a PDF file represented as a byte stream, inserts an image
-    located at a predefined path onto the last page of the PDF in a specific
+    This function takes a PDF file represented as a byte stream, draws the stamp
+    preloaded by ``pdf_stamper`` onto the last page of the PDF in a specific
     rectangle area defined by coordinates and dimensions, and returns the modified
     PDF as a byte stream.
 
@@ -26,19 +27,39 @@ def insert_image_into_pdf(data: bytes, x: int = 380, y: int = 680, w: int = 200,
     Returns:
         bytes: The modified PDF as a byte stream.
     """
-    # Open the PDF
-    doc = fitz.open(stream=data, filetype="pdf")
+    return pdf_stamper.stamp_pdf(data, box=(x, y, w, h))
 
-    # Select the last page
-    last_page = doc[-1]
 
-    # Create a rectangle specifying position/size
-    # (top-left at (x, y), bottom-right at (x + w, y + h))
-    image_rect = fitz.Rect(x, y, x + w, y + h)
+def link_rca_companies(insurers: list[dict], rca_companies: dict | None = None) -> list[dict]:
+    """
+    Apply the RCA company settings to the insurers of a serialized quote.
+
+    Insurers unknown to the database are registered as active public companies. Insurers whose
+    company is not public are dropped, and the remaining ones get the company's activity flag and
+    logo.
+
+    Parameters:
+        insurers (list[dict]): The serialized ``InsurerPrimeRCAI`` or ``InsurerPrimeRCAE`` entries.
+        rca_companies (dict | None): The ``RCACompany`` objects by IDNO, to reuse across several quotes.
+            Loaded from the database when omitted.
 
-    # Insert the image into the rectangle
-    last_page.insert_image(image_rect, filename="./stamp.png")
+    Returns:
+        list[dict]: The insurers that should be shown to the client.
+    """
+    if rca_companies is None:
+        rca_companies = {company.idno: company for company in RCACompany.objects.all()}
 
-    with BytesIO() as output:
-        output.write(doc.write())
-        return output.getvalue()
+    linked = []
+    for insurer in insurers:
+        company = rca_companies.get(insurer["IDNO"])
+        if not company:
+            company = RCACompany.objects.create(
+                name=insurer["Name"], idno=insurer["IDNO"], is_active=True, is_public=True
+            )
+            rca_companies[company.idno] = company
+        if not company.is_public:
+            continue
+        insurer["is_active"] = company.is_active
+        insurer["logo"] = company.logo.url if company.logo else static("public/default-logo.png")
+        linked.append(insurer)
+    return linked
@@ -0,0 +1,122 @@
+import contextlib
+import functools
+import multiprocessing
+import resource
+import time
+from pathlib import Path
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def merge_with_pypdf2(documents: list[bytes]) -> bytes:
+    """
+    The previous merge path of the document tasks, kept as the benchmark baseline.
+    """
+    from io import BytesIO
+
+    import PyPDF2
+
+    pdf_writer = PyPDF2.PdfWriter()
+    for content in documents:
+        pdf_reader = PyPDF2.PdfReader(BytesIO(content))
+        for page in pdf_reader.pages:
+            pdf_writer.add_page(page)
+    merged_stream = BytesIO()
+    pdf_writer.write(merged_stream)
+    return merged_stream.getvalue()
+
+
+def merge_with_pymupdf(documents: list[bytes], garbage: int) -> bytes:
+    from apps.ensurance.pdf import merge_pdfs
+
+    return merge_pdfs(documents, garbage=garbage)
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak RSS of the current process in KiB.
+
+    ``VmHWM`` is preferred because ``ru_maxrss`` keeps the high-water mark of the forking parent.
+    """
+    with contextlib.suppress(OSError):
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_engine(engine: str, documents: list[bytes], iterations: int, garbage: int, queue) -> None:
+    """
+    Runs one engine in its own process so that its peak RSS is not shared with the other one.
+
+    The library is loaded by a first, untimed merge, so the timings only cover the merges themselves, and
+    the memory taken by loading the library, paid once per worker, is reported apart from the merges.
+    """
+    if engine == "pymupdf":
+        merge = functools.partial(merge_with_pymupdf, documents, garbage)
+    else:
+        merge = functools.partial(merge_with_pypdf2, documents)
+    baseline = get_peak_rss()
+    merge()
+    loaded = get_peak_rss()
+
+    timings, size = [], 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        size = len(merge())
+        timings.append(time.perf_counter() - started)
+    peak = get_peak_rss()
+    queue.put({"timings": timings, "size": size, "peak": peak, "loaded": loaded, "baseline": baseline})
+
+
+class Command(BaseCommand):
+    help = "Compare the time and peak RSS of the PyMuPDF merge engine with the previous PyPDF2 merge."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "files",
+            nargs="*",
+            help="PDF files to merge, in order. Defaults to test.pdf repeated --copies times.",
+        )
+        parser.add_argument("--copies", type=int, default=3, help="Copies of test.pdf to merge when no file is given.")
+        parser.add_argument("--iterations", type=int, default=10, help="Number of merges per engine.")
+        parser.add_argument(
+            "--garbage",
+            type=int,
+            default=settings.PDF_MERGE_GARBAGE,
+            help="PyMuPDF garbage collection level used on save.",
+        )
+
+    def handle(self, *args, **options):
+        paths = [Path(path) for path in options["files"]] or [settings.BASE_DIR / "test.pdf"] * options["copies"]
+        missing = [str(path) for path in paths if not path.exists()]
+        if missing:
+            raise CommandError(f"Files not found: {', '.join(missing)}")
+        documents = [path.read_bytes() for path in paths]
+        self.stdout.write(f"Merging {len(documents)} files ({sum(map(len, documents)) / 1024:.1f} KiB)")
+
+        context = multiprocessing.get_context("spawn")
+        results = {}
+        for engine in ("pypdf2", "pymupdf"):
+            queue = context.Queue()
+            process = context.Process(
+                target=run_engine, args=(engine, documents, options["iterations"], options["garbage"], queue)
+            )
+            process.start()
+            results[engine] = queue.get()
+            process.join()
+
+            result = results[engine]
+            self.stdout.write(
+                f"{engine}: median {median(result['timings']) * 1000:.2f} ms per merge "
+                f"(max {max(result['timings']) * 1000:.2f} ms), "
+                f"peak RSS {result['peak'] / 1024:.1f} MiB "
+                f"(+{(result['loaded'] - result['baseline']) / 1024:.1f} MiB to load and run once, "
+                f"+{(result['peak'] - result['loaded']) / 1024:.1f} MiB more during the timed merges), "
+                f"output {result['size'] / 1024:.1f} KiB"
+            )
+
+        speedup = median(results["pypdf2"]["timings"]) / median(results["pymupdf"]["timings"])
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {speedup:.1f}x"))
@@ -0,0 +1,49 @@
+import time
+from statistics import mean
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from zeep import Client
+from zeep.transports import Transport
+
+from apps.ensurance.rca import RcaExportServiceClient, rca_client_registry
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of building an RcaExportServiceClient with and without the shared WSDL registry."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Number of clients to build per scenario.")
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Do not measure the legacy path that downloads and parses the WSDL for every client.",
+        )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+
+        rca_client_registry.clear()
+        started = time.perf_counter()
+        RcaExportServiceClient()
+        cold = time.perf_counter() - started
+        self.stdout.write(f"Registry cold start: {cold * 1000:.2f} ms")
+
+        warm = self.measure(RcaExportServiceClient, iterations)
+        self.stdout.write(f"Registry per request: {mean(warm) * 1000:.2f} ms (max {max(warm) * 1000:.2f} ms)")
+
+        if options["skip_legacy"]:
+            return
+
+        legacy = self.measure(lambda: Client(wsdl=settings.RCA_URL, transport=Transport(timeout=30)), iterations)
+        self.stdout.write(f"Legacy per request: {mean(legacy) * 1000:.2f} ms (max {max(legacy) * 1000:.2f} ms)")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {mean(legacy) / mean(warm):.1f}x"))
+
+    @staticmethod
+    def measure(factory, iterations: int) -> list[float]:
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            factory()
+            timings.append(time.perf_counter() - started)
+        return timings
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensurance', '0010_file_data'),
+        ('payment', '0016_maibpayment_is_used'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('RCA', 'RCA'), ('GreenCard', 'Green Card'), ('MedicalInsurance', 'Medical Insurance'), ('QR', 'QR'), ('Other', 'Other')], max_length=50, verbose_name='Type')),
+                ('status', models.CharField(choices=[('claimed', 'Claimed'), ('saved', 'Saved'), ('released', 'Released')], default='claimed', max_length=10, verbose_name='Status')),
+                ('external_id', models.CharField(blank=True, max_length=50, null=True, verbose_name='Document ID')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('maib_payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='payment.maibpayment')),
+                ('qr_code', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='payment.qrcode')),
+            ],
+            options={
+                'verbose_name': 'Payment Claim',
+                'verbose_name_plural': 'Payment Claims',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='ensurance_p_status_332516_idx')],
+            },
+        ),
+    ]
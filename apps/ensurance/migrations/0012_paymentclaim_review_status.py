@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensurance', '0011_paymentclaim'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentclaim',
+            name='status',
+            field=models.CharField(choices=[('claimed', 'Claimed'), ('saved', 'Saved'), ('released', 'Released'), ('review', 'Needs review')], default='claimed', max_length=10, verbose_name='Status'),
+        ),
+    ]
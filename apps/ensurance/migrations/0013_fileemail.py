@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensurance', '0012_paymentclaim_review_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=50, verbose_name='Document ID')),
+                ('contract_type', models.CharField(choices=[('RCAI', 'RCAI'), ('CV', 'CV')], default='RCAI', max_length=10)),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('link', models.BooleanField(default=False, help_text='Send a signed download link instead of the file')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt at')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'File Email',
+                'verbose_name_plural': 'File Emails',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='ensurance_f_status_e020cd_idx')],
+            },
+        ),
+    ]
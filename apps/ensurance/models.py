@@ -3,10 +3,11 @@ from django.core.files.storage import default_storage
 from django.db import models
 from django.db.models.signals import post_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_minio_backend import MinioBackend, iso_date_prefix
 
-from apps.ensurance.constants import FileTypes
+from apps.ensurance.constants import ContractType, EmailStatus, FileTypes, PaymentClaimStatus
 
 
 class File(models.Model):
@@ -81,3 +82,66 @@ class MedicalInsuranceCompany(models.Model):
     class Meta:
         verbose_name = _("Medical Insurance Company")
         verbose_name_plural = _("Medical Insurance Companies")
+
+
+class PaymentClaim(models.Model):
+    """
+    Outbox record of a payment used to save an insurance document.
+
+    The claim is written in the same short transaction that marks the payment as used, before the
+    document is saved with BNM or Donaris. It is then either completed with the ``external_id`` of the
+    saved document or released together with the payment, so interrupted saves can be recovered.
+    """
+
+    type = models.CharField(max_length=50, choices=FileTypes.choices, verbose_name=_("Type"))
+    status = models.CharField(
+        max_length=10,
+        choices=PaymentClaimStatus.choices,
+        default=PaymentClaimStatus.CLAIMED,
+        verbose_name=_("Status"),
+    )
+    qr_code = models.ForeignKey("payment.QrCode", on_delete=models.PROTECT, null=True, blank=True)
+    maib_payment = models.ForeignKey("payment.MaibPayment", on_delete=models.PROTECT, null=True, blank=True)
+    external_id = models.CharField(max_length=50, blank=True, null=True, verbose_name=_("Document ID"))
+    error = models.TextField(blank=True, null=True, verbose_name=_("Error"))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payment Claim {self.pk} - {self.status}"
+
+    class Meta:
+        verbose_name = _("Payment Claim")
+        verbose_name_plural = _("Payment Claims")
+        indexes = [models.Index(fields=["status", "updated_at"])]
+
+
+class FileEmail(models.Model):
+    """
+    Outbox record of a stored file to send by email.
+
+    ``send-file`` only writes the record. ``send_queued_emails`` then sends the pending records in batches over
+    one SMTP connection and marks each one as sent right after its own message, so a retried batch never
+    sends a message twice.
+    """
+
+    external_id = models.CharField(max_length=50, verbose_name=_("Document ID"))
+    contract_type = models.CharField(max_length=10, choices=ContractType.choices, default=ContractType.RCAI)
+    email = models.EmailField(verbose_name=_("Email"))
+    link = models.BooleanField(default=False, help_text="Send a signed download link instead of the file")
+    status = models.CharField(
+        max_length=10, choices=EmailStatus.choices, default=EmailStatus.PENDING, verbose_name=_("Status")
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_("Attempts"))
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name=_("Next attempt at"))
+    error = models.TextField(blank=True, null=True, verbose_name=_("Error"))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"File Email {self.external_id} to {self.email} - {self.status}"
+
+    class Meta:
+        verbose_name = _("File Email")
+        verbose_name_plural = _("File Emails")
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
@@ -0,0 +1,118 @@
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+import fitz
+from django.conf import settings
+
+# Default stamp position and size on the page: (x, y, width, height)
+STAMP_BOX = (380, 680, 200, 200)
+
+
+class PdfStamper:
+    """
+    Stamps PDF pages with the company stamp image.
+
+    The stamp is read and encoded once per process into a one-page PDF, which is then drawn on the pages
+    with ``show_pdf_page``. The image is never decoded again, and PyMuPDF embeds it only once per target
+    document, however many pages are stamped.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def stamp(self) -> bytes:
+        """
+        Returns the stamp as a PDF, loading it from ``PDF_STAMP_PATH`` on first use.
+        """
+        if self._stamp is None:
+            with self._lock:
+                if self._stamp is None:
+                    self._stamp = self.load(self.path or settings.PDF_STAMP_PATH)
+        return self._stamp
+
+    @staticmethod
+    def load(path: str) -> bytes:
+        image = Path(path).read_bytes()
+        with fitz.open(stream=image, filetype=Path(path).suffix.lstrip(".") or "png") as picture:
+            rect = picture[0].rect
+        with fitz.open() as stamp:
+            page = stamp.new_page(width=rect.width, height=rect.height)
+            page.insert_image(page.rect, stream=image)
+            return stamp.tobytes(garbage=3, deflate=True)
+
+    def stamp_document(
+        self, document: fitz.Document, pages: Iterable[int] | None = None, box: tuple = STAMP_BOX
+    ) -> None:
+        """
+        Stamps pages of an open document in place.
+
+        Parameters:
+            document (fitz.Document): The document to stamp.
+            pages (Iterable[int] | None): The page numbers to stamp. Defaults to the last page.
+            box (tuple): The ``(x, y, width, height)`` of the stamp on each page.
+        """
+        x, y, w, h = box
+        rect = fitz.Rect(x, y, x + w, y + h)
+        with fitz.open(stream=self.stamp, filetype="pdf") as stamp:
+            for number in [-1] if pages is None else pages:
+                document[number].show_pdf_page(rect, stamp, 0)
+
+    def stamp_pdf(self, data: bytes, pages: Iterable[int] | None = None, box: tuple = STAMP_BOX) -> bytes:
+        """
+        Stamps pages of a PDF.
+
+        Parameters:
+            data (bytes): The PDF to stamp.
+            pages (Iterable[int] | None): The page numbers to stamp. Defaults to the last page.
+            box (tuple): The ``(x, y, width, height)`` of the stamp on each page.
+
+        Returns:
+            bytes: The stamped PDF.
+        """
+        with fitz.open(stream=data, filetype="pdf") as document:
+            self.stamp_document(document, pages, box)
+            return document.tobytes(garbage=settings.PDF_MERGE_GARBAGE, deflate=True)
+
+
+pdf_stamper = PdfStamper()
+
+
+def merge_pdfs(
+    documents: Iterable[bytes], garbage: int | None = None, deflate: bool = True, stamp: bool = False
+) -> bytes:
+    """
+    Merge PDF documents into a single PDF with PyMuPDF.
+
+    The pages are copied with ``fitz.Document.insert_pdf``, which works on the PDF objects directly
+    instead of re-parsing every page in Python, and the stamping happens on the same document before a
+    single save. Loading MuPDF costs about 28 MiB of RSS once per worker, see ``benchmark_pdf_merge``.
+
+    Parameters:
+        documents (Iterable[bytes]): The PDF files to merge, in order.
+        garbage (int | None): The PyMuPDF garbage collection level applied on save, from 0 (off) to 4
+            (also merge duplicate streams). Defaults to ``PDF_MERGE_GARBAGE``.
+        deflate (bool): Whether to compress uncompressed streams on save. Defaults to True.
+        stamp (bool): Whether to stamp the last page of every merged document with ``pdf_stamper``.
+            The stamping is done on the merged document, before it is saved once.
+
+    Returns:
+        bytes: The merged PDF.
+    """
+    garbage = settings.PDF_MERGE_GARBAGE if garbage is None else garbage
+
+    merged = fitz.open()
+    try:
+        last_pages = []
+        for content in documents:
+            with fitz.open(stream=content, filetype="pdf") as document:
+                merged.insert_pdf(document)
+            last_pages.append(merged.page_count - 1)
+        if stamp:
+            pdf_stamper.stamp_document(merged, last_pages)
+        return merged.tobytes(garbage=garbage, deflate=deflate)
+    finally:
+        merged.close()
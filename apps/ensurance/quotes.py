@@ -0,0 +1,358 @@
+import hashlib
+import json
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.serializers import Serializer
+from zeep.helpers import serialize_object
+
+from apps.common.cache import acoalesce, coalesce
+from apps.ensurance.constants import OperationModes
+from apps.ensurance.donaris import MedicinaAPI
+from apps.ensurance.rca import RcaExportServiceClient, rca_token_manager
+from apps.ensurance.serializers import CalculateGreenCardOutputSerializer, CalculateRCAOutputSerializer
+
+
+class QuoteCache:
+    """
+    TTL cache of serialized quotes keyed by the normalized validated input of a calculate action.
+
+    Successful quotes are stored as the payload of the output serializer for ``timeout`` seconds.
+    Quotes rejected by BNM (``IsSuccess`` is false) are stored for ``error_timeout`` seconds and
+    raised again as ``ValidationError`` on a hit. Hits and misses are counted in the cache so the
+    counters are shared by all workers.
+
+    Company settings are not part of the cached payload and must be applied after the lookup.
+    """
+
+    def __init__(self, name: str, timeout: int, error_timeout: int, fold_case: bool = True):
+        self.name = name
+        self.timeout = timeout
+        self.error_timeout = error_timeout
+        self.fold_case = fold_case
+
+    def normalize(self, data):
+        """
+        Returns a canonical copy of ``data``: strings are stripped and upper-cased (unless ``fold_case`` is
+        false), blanks become None. Nested dictionaries and lists are normalized as well.
+        """
+        if isinstance(data, dict):
+            return {key: self.normalize(value) for key, value in data.items()}
+        if isinstance(data, list | tuple):
+            return [self.normalize(value) for value in data]
+        if isinstance(data, str):
+            data = data.strip()
+            return (data.upper() if self.fold_case else data) or None
+        return data
+
+    def get_key(self, data: dict) -> str:
+        digest = hashlib.sha256(json.dumps(self.normalize(data), sort_keys=True, default=str).encode()).hexdigest()
+        return f"quote:{self.name}:{digest}"
+
+    def get(self, data: dict) -> dict | None:
+        """
+        Returns the cached payload for ``data`` or None on a miss.
+
+        Raises:
+            ValidationError: If BNM rejected the same input recently.
+        """
+        entry = cache.get(self.get_key(data))
+        self.count("hits" if entry is not None else "misses")
+        if entry is None:
+            return None
+        if "error" in entry:
+            raise ValidationError(detail=entry["error"])
+        return entry["payload"]
+
+    def set(self, data: dict, payload: dict):
+        cache.set(self.get_key(data), {"payload": payload}, self.timeout)
+
+    def set_error(self, data: dict, detail):
+        cache.set(self.get_key(data), {"error": detail}, self.error_timeout)
+
+    def count(self, counter: str):
+        key = f"quote:{self.name}:{counter}"
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter was evicted between add and incr
+            cache.set(key, 1, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": cache.get(f"quote:{self.name}:hits", 0),
+            "misses": cache.get(f"quote:{self.name}:misses", 0),
+        }
+
+
+rca_quote_cache = QuoteCache("rca", settings.RCA_QUOTE_CACHE_TTL, settings.RCA_QUOTE_ERROR_CACHE_TTL)
+green_card_quote_cache = QuoteCache("green-card", settings.RCA_QUOTE_CACHE_TTL, settings.RCA_QUOTE_ERROR_CACHE_TTL)
+# Names are echoed back in the tariff, so their case is kept in the key
+medical_tariff_cache = QuoteCache(
+    "medical", settings.MEDICAL_TARIFF_CACHE_TTL, settings.MEDICAL_TARIFF_ERROR_CACHE_TTL, fold_case=False
+)
+
+
+def serialize_quote(response, output_serializer_class: type[Serializer]) -> dict:
+    """
+    Validates a zeep quote response with ``output_serializer_class`` and returns its payload.
+    """
+    output_serializer = output_serializer_class(data=serialize_object(response))
+    output_serializer.is_valid(raise_exception=True)
+    return output_serializer.data
+
+
+def get_quote(
+    quote_cache: QuoteCache, calculate: Callable, output_serializer_class: type[Serializer], validated_data: dict
+) -> dict:
+    """
+    Returns the serialized quote for ``validated_data`` from ``quote_cache`` or by calling ``calculate``.
+
+    Parameters:
+        quote_cache (QuoteCache): The cache of the quote type.
+        calculate (Callable): The client method performing the SOAP call, e.g. ``client.calculate_rca``.
+        output_serializer_class (type[Serializer]): The serializer validating the SOAP response.
+        validated_data (dict): The validated input of the calculate action.
+
+    Concurrent identical requests are coalesced into a single upstream call.
+
+    Returns:
+        dict: The payload of ``output_serializer_class``, without company settings applied.
+    """
+    payload = quote_cache.get(validated_data)
+    if payload is not None:
+        return payload
+
+    def fetch():
+        try:
+            response = calculate(validated_data)
+        except ValidationError as e:
+            quote_cache.set_error(validated_data, e.detail)
+            raise
+        payload = serialize_quote(response, output_serializer_class)
+        quote_cache.set(validated_data, payload)
+        return payload
+
+    # Identical requests in flight on any worker share a single upstream call
+    return coalesce(f"{quote_cache.get_key(validated_data)}:inflight", fetch)
+
+
+async def aget_quote(
+    quote_cache: QuoteCache, calculate: Callable, output_serializer_class: type[Serializer], validated_data: dict
+) -> dict:
+    """
+    Async counterpart of ``get_quote`` where ``calculate`` is a coroutine function.
+    """
+    payload = await sync_to_async(quote_cache.get)(validated_data)
+    if payload is not None:
+        return payload
+
+    async def fetch():
+        try:
+            response = await calculate(validated_data)
+        except ValidationError as e:
+            await sync_to_async(quote_cache.set_error)(validated_data, e.detail)
+            raise
+        payload = serialize_quote(response, output_serializer_class)
+        await sync_to_async(quote_cache.set)(validated_data, payload)
+        return payload
+
+    return await acoalesce(f"{quote_cache.get_key(validated_data)}:inflight", fetch)
+
+
+def get_rca_quote(client, validated_data: dict) -> dict:
+    return get_quote(rca_quote_cache, client.calculate_rca, CalculateRCAOutputSerializer, validated_data)
+
+
+def get_green_card_quote(client, validated_data: dict) -> dict:
+    return get_quote(
+        green_card_quote_cache, client.calculate_green_card, CalculateGreenCardOutputSerializer, validated_data
+    )
+
+
+def get_medical_tariff(validated_data: dict) -> dict:
+    """
+    Returns the Donaris tariff for the validated ``CalculateRootSerializer`` data, from ``medical_tariff_cache``
+    or by calling ``medicina_calcul_tarif``.
+
+    The form asks for a tariff on every change, so repeated inputs are answered from the cache and identical
+    requests in flight share a single Donaris call. Only inputs rejected by Donaris are cached as errors;
+    server errors (``DonarisUnavailable``) and connection errors are not.
+
+    Parameters:
+        validated_data (dict): The validated input of ``calculate-medical-insurance``.
+
+    Returns:
+        dict: The tariff response, without the company fields.
+    """
+    payload = medical_tariff_cache.get(validated_data)
+    if payload is not None:
+        return payload
+
+    def fetch():
+        try:
+            payload = MedicinaAPI().calculate_tariff(validated_data)
+        except ValidationError as e:
+            medical_tariff_cache.set_error(validated_data, e.detail)
+            raise
+        medical_tariff_cache.set(validated_data, payload)
+        return payload
+
+    return coalesce(f"{medical_tariff_cache.get_key(validated_data)}:inflight", fetch)
+
+
+def run_concurrently(calls: dict, max_workers: int = None) -> tuple[dict, dict]:
+    """
+    Runs the quote ``calls`` in a bounded thread pool.
+
+    Parameters:
+        calls (dict): The callables without arguments, by key.
+        max_workers (int): The size of the pool, ``RCA_QUOTE_MAX_WORKERS`` by default.
+
+    Returns:
+        tuple[dict, dict]: The results and the raised ``APIException``s, by key.
+    """
+    max_workers = min(max_workers or settings.RCA_QUOTE_MAX_WORKERS, len(calls)) or 1
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(call) for key, call in calls.items()}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except APIException as e:
+                errors[key] = e
+    return results, errors
+
+
+def get_rca_quote_matrix(validated_data: dict) -> dict:
+    """
+    Returns the RCA premiums of every insurer for all operating modes at once.
+
+    The security token is obtained once, then one ``CalculateRCAIPremium`` per ``OperationModes`` value is
+    run concurrently through ``get_rca_quote``, so cached and in-flight quotes are reused. A mode rejected
+    by BNM is reported in ``Errors`` instead of failing the whole matrix.
+
+    Parameters:
+        validated_data (dict): The validated ``CalculateRCAMatrixInputSerializer`` data.
+
+    Returns:
+        dict: The person and vehicle details, the insurers with their ``Premiums`` keyed by operating mode,
+            and the ``Errors`` keyed by operating mode. Company settings are not applied.
+
+    Raises:
+        APIException: If no operating mode could be quoted.
+    """
+    rca_token_manager.get_token(RcaExportServiceClient)
+
+    def quote(operating_mode):
+        return lambda: get_rca_quote(RcaExportServiceClient(), {**validated_data, "OperatingModes": operating_mode})
+
+    modes = OperationModes.values
+    results, errors = run_concurrently({mode: quote(mode) for mode in modes}, max_workers=len(modes))
+    if not results:
+        raise next(iter(errors.values()))
+
+    matrix = {key: value for key, value in next(iter(results.values())).items() if key != "InsurersPrime"}
+    insurers = {}
+    for mode, payload in results.items():
+        for insurer in payload["InsurersPrime"]["InsurerPrimeRCAI"]:
+            entry = insurers.setdefault(
+                insurer["IDNO"], {"Name": insurer["Name"], "IDNO": insurer["IDNO"], "Premiums": {}}
+            )
+            entry["Premiums"][mode] = {"PrimeSum": insurer["PrimeSum"], "PrimeSumMDL": insurer["PrimeSumMDL"]}
+    matrix["Insurers"] = list(insurers.values())
+    matrix["Errors"] = {mode: e.detail for mode, e in errors.items()}
+    return matrix
+
+
+def get_green_card_quote_grid(validated_data: dict) -> dict:
+    """
+    Returns the Green Card premiums for a set of zone and term combinations.
+
+    The security token is obtained once, then the ``CalculateRCAEPremium`` calls run concurrently in a pool
+    of ``RCA_QUOTE_MAX_WORKERS`` threads through ``get_green_card_quote``. Each cell holds either the insurers
+    of its quote or the error returned for it, so one rejected combination does not fail the batch.
+
+    Parameters:
+        validated_data (dict): The validated ``CalculateGreenCardGridInputSerializer`` data.
+
+    Returns:
+        dict: The person and vehicle details of the first successful quote and the ``Grid`` of cells indexed
+            by zone and term. Company settings are not applied.
+    """
+    rca_token_manager.get_token(RcaExportServiceClient)
+
+    def quote(zone, term):
+        data = {
+            "GreenCardZone": zone,
+            "TermInsurance": term,
+            "IDNX": validated_data["IDNX"],
+            "VehicleRegistrationCertificateNumber": validated_data["VehicleRegistrationCertificateNumber"],
+        }
+        return lambda: get_green_card_quote(RcaExportServiceClient(), data)
+
+    combinations = {(item["GreenCardZone"], item["TermInsurance"]) for item in validated_data["Combinations"]}
+    results, errors = run_concurrently({combination: quote(*combination) for combination in sorted(combinations)})
+
+    grid = {}
+    if results:
+        grid = {key: value for key, value in next(iter(results.values())).items() if key != "InsurersPrime"}
+    grid["Grid"] = {}
+    for zone, term in sorted(combinations):
+        if (zone, term) in results:
+            cell = {"Insurers": results[zone, term]["InsurersPrime"]["InsurerPrimeRCAE"], "Error": None}
+        else:
+            cell = {"Insurers": [], "Error": errors[zone, term].detail}
+        grid["Grid"].setdefault(zone, {})[term] = cell
+    return grid
+
+
+def iter_rca_fleet_quotes(validated_data: dict) -> Iterator[tuple[str, dict | None, dict | None]]:
+    """
+    Returns an iterator over the RCA quote of every vehicle of a fleet, yielded as soon as it is available.
+
+    The security token is obtained once, right away, so an authentication failure is raised by this call
+    rather than while the quotes are consumed, e.g. after a streaming response has started. Then one
+    ``CalculateRCAIPremium`` per registration certificate runs in a pool of ``RCA_QUOTE_MAX_WORKERS`` threads
+    through ``get_rca_quote``. Quotes are yielded in completion order, and pending calls are cancelled when
+    the consumer stops iterating.
+
+    Parameters:
+        validated_data (dict): The validated ``CalculateRCAFleetInputSerializer`` data.
+
+    Returns:
+        Iterator[tuple[str, dict | None, dict | None]]: The registration certificate number, the serialized
+            quote without company settings, and the error detail when the quote failed.
+
+    Raises:
+        APIException: If the security token could not be obtained.
+    """
+    try:
+        rca_token_manager.get_token(RcaExportServiceClient)
+    except Exception as e:  # noqa: BLE001
+        raise APIException(detail={"detail": str(e)}) from e
+    return _iter_rca_fleet_quotes(validated_data)
+
+
+def _iter_rca_fleet_quotes(validated_data: dict) -> Iterator[tuple[str, dict | None, dict | None]]:
+    data = {key: validated_data[key] for key in ("PersonIsJuridical", "IDNX", "OperatingModes")}
+    executor = ThreadPoolExecutor(max_workers=settings.RCA_QUOTE_MAX_WORKERS)
+    try:
+        futures = {
+            executor.submit(
+                get_rca_quote, RcaExportServiceClient(), {**data, "VehicleRegistrationCertificateNumber": number}
+            ): number
+            for number in validated_data["VehicleRegistrationCertificateNumbers"]
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except APIException as e:
+                yield futures[future], None, e.detail
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
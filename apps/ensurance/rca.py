@@ -1,18 +1,240 @@
+import asyncio
+import functools
+import os
+import re
+import threading
+import weakref
+from collections.abc import Callable
+from pathlib import Path
+
 import zeep
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework.exceptions import APIException, ValidationError
-from zeep import Client
-from zeep.exceptions import TransportError
-from zeep.transports import Transport
-
+from zeep import AsyncClient, Client
+from zeep.cache import SqliteCache
+from zeep.exceptions import Fault, TransportError
+from zeep.proxy import AsyncServiceProxy, ServiceProxy
+from zeep.transports import AsyncTransport, Transport
+from zeep.wsdl import Document
+
+from apps.common.cache import get_or_set_single_flight
 from apps.ensurance.constants import PaymentModes, TermInsurance
 
 
-class RcaExportServiceClient:
+class RcaClientRegistry:
+    """
+    Process-wide registry of parsed RCA WSDL documents.
+
+    Parsing the BNM ``RcaExportService`` WSDL is far more expensive than a single SOAP call, so the
+    parsed ``zeep.wsdl.Document`` is built once per process and shared by every client. The WSDL is
+    loaded from the vendored copy at ``settings.RCA_WSDL_PATH`` when it exists, otherwise it is
+    downloaded from the service URL through zeep's persistent ``SqliteCache``.
+
+    The registry is keyed by process id, so documents and HTTP sessions built before a fork
+    (gunicorn, Celery prefork) are never reused by the child process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._transport = None
+        self._async_transports = weakref.WeakKeyDictionary()
+        self._documents = {}
+
+    def _reset_if_forked(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._transport = None
+            self._async_transports = weakref.WeakKeyDictionary()
+            self._documents = {}
+
+    def get_transport(self) -> Transport:
+        """
+        Returns the transport shared by all clients of the current process.
+        """
+        with self._lock:
+            self._reset_if_forked()
+            if self._transport is None:
+                cache = SqliteCache(path=settings.RCA_WSDL_CACHE_PATH, timeout=settings.RCA_WSDL_CACHE_TIMEOUT)
+                self._transport = Transport(timeout=30, cache=cache)
+            return self._transport
+
+    def get_async_transport(self) -> AsyncTransport:
+        """
+        Returns the httpx based transport shared by all async clients of the running event loop.
+
+        httpx connection pools are bound to the event loop they were created in, so a transport is kept
+        per loop instead of per process.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._reset_if_forked()
+            transport = self._async_transports.get(loop)
+            if transport is None:
+                transport = AsyncTransport(timeout=30)
+                self._async_transports[loop] = transport
+            return transport
+
+    def get_document(self, wsdl_url: str) -> Document:
+        """
+        Returns the parsed WSDL document for ``wsdl_url``, loading it on first use.
+        """
+        transport = self.get_transport()
+        with self._lock:
+            document = self._documents.get(wsdl_url)
+            if document is None:
+                document = Document(self.get_wsdl_location(wsdl_url), transport, settings=zeep.Settings())
+                self._documents[wsdl_url] = document
+            return document
+
+    @staticmethod
+    def get_wsdl_location(wsdl_url: str) -> str:
+        """
+        Returns the vendored WSDL path if it exists, otherwise the remote WSDL url.
+        """
+        wsdl_path = Path(settings.RCA_WSDL_PATH) if settings.RCA_WSDL_PATH else None
+        if wsdl_path and wsdl_path.is_file():
+            return wsdl_path.as_posix()
+        return wsdl_url
+
+    def get_client(self, wsdl_url: str) -> Client:
+        """
+        Returns a lightweight ``zeep.Client`` bound to the shared document and transport.
+        """
+        return Client(wsdl=self.get_document(wsdl_url), transport=self.get_transport())
+
+    def get_service(self, client: Client, wsdl_url: str):
+        """
+        Returns a service proxy for ``client``.
+
+        When the WSDL comes from the vendored copy, the proxy is bound to the address of ``wsdl_url``
+        so the same file can be used against the test and production services.
+        """
+        if self.get_wsdl_location(wsdl_url) == wsdl_url:
+            return client.service
+        service = next(iter(client.wsdl.services.values()))
+        port = next(iter(service.ports.values()))
+        proxy_class = AsyncServiceProxy if isinstance(client, AsyncClient) else ServiceProxy
+        return proxy_class(client, port.binding, address=wsdl_url.split("?")[0])
+
+    def clear(self):
+        """
+        Drops every cached document, forcing the next client to reload the WSDL.
+        """
+        with self._lock:
+            self._documents = {}
+
+
+rca_client_registry = RcaClientRegistry()
+
+
+class RcaSecurityTokenManager:
+    """
+    Shares the RCA ``SecurityToken`` between all gunicorn and Celery workers.
+
+    The GUID returned by ``Authenticate`` is kept in the default cache for
+    ``settings.RCA_SECURITY_TOKEN_TTL`` seconds. When it is missing, only one worker authenticates
+    while the others wait for the new token. A token rejected by the service is dropped from the
+    cache so the next caller authenticates again.
+    """
+
+    def __init__(self, timeout: int = settings.RCA_SECURITY_TOKEN_TTL):
+        self.timeout = timeout
+
+    @staticmethod
+    def get_cache_key(username: str) -> str:
+        return f"rca:security-token:{username}"
+
+    def get_token(
+        self,
+        client: "RcaExportServiceClient | Callable[[], RcaExportServiceClient]",
+        username: str = settings.RCA_USERNAME,
+        password: str = settings.RCA_PASSWORD,
+    ) -> str:
+        """
+        Returns the shared security token, authenticating through ``client`` if there is none.
+
+        ``client`` may be a callable returning the client, e.g. the ``RcaExportServiceClient`` class, so that
+        the client is only built when a token is actually missing.
+        """
+
+        def authenticate():
+            authenticating_client = client() if callable(client) else client
+            return authenticating_client.authenticate(username=username, password=password).AuthenticateResult
+
+        return get_or_set_single_flight(self.get_cache_key(username), authenticate, timeout=self.timeout)
+
+    def invalidate(self, token: str, username: str = settings.RCA_USERNAME):
+        """
+        Drops ``token`` from the cache unless another worker has already replaced it.
+        """
+        key = self.get_cache_key(username)
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+rca_token_manager = RcaSecurityTokenManager()
+
+
+# The RCA service reports a rejected SecurityToken only through the error text, in English or in Romanian,
+# e.g. "SecurityToken is invalid or expired" or "Token-ul de securitate a expirat"
+SECURITY_TOKEN_NAME = r"(?:security\s*token|token(?:-ul)?\s+de\s+securitate)"
+SECURITY_TOKEN_REJECTION = r"(?:invalid|expired|not\s+valid|not\s+found|unknown|a\s+expirat|expirat|nevalid|inexistent)"
+TOKEN_REJECTED_RE = re.compile(
+    rf"{SECURITY_TOKEN_NAME}\W+(?:\w+\W+){{0,3}}?{SECURITY_TOKEN_REJECTION}"
+    rf"|{SECURITY_TOKEN_REJECTION}\W+(?:\w+\W+){{0,3}}?{SECURITY_TOKEN_NAME}",
+    re.IGNORECASE,
+)
+
+
+def is_token_rejected(message) -> bool:
+    """
+    Returns whether an error message returned by the RCA service says that the security token is invalid or
+    expired.
+
+    Other errors that merely mention a token, e.g. about the request data, are not retried.
+    """
+    return bool(message) and TOKEN_REJECTED_RE.search(str(message)) is not None
+
+
+class RcaRequestBuilderMixin:
+    """
+    Builds the request objects of the quote operations from the WSDL types of ``self.client``.
+
+    Shared by the sync and async RCA clients so both send exactly the same requests.
+    """
+
+    client: Client
+
+    def build_calculate_rca_request(self, request_obj: dict):
+        Employee = self.client.get_type("ns0:EmployeeInput")(IDNP=settings.ASIG_IDNP)
+        RequestType = self.client.get_type("ns0:CalculateRCAIPremiumRequest")
+        return RequestType(Employee=Employee, **request_obj)
+
+    def build_calculate_green_card_request(self, request_obj: dict):
+        Employee = self.client.get_type("ns0:EmployeeInput")(IDNP=settings.ASIG_IDNP)
+        RequestType = self.client.get_type("ns0:CalculateRCAEPremiumRequest")
+        return RequestType(Employee=Employee, **request_obj)
+
+    @staticmethod
+    def get_error_message(response) -> str | None:
+        """
+        Extracts the error message of an unsuccessful service response.
+        """
+        if getattr(response, "IsSuccess", None) is False:
+            return response.ErrorMessage
+        if getattr(response, "Success", None) is False and response.Errors:
+            return " ".join(response.Errors.string or [])
+        return None
+
+
+class RcaExportServiceClient(RcaRequestBuilderMixin):
     def __init__(self, wsdl_url=settings.RCA_URL):
-        self.transport = Transport(timeout=30)
-        self.client = Client(wsdl=wsdl_url, transport=self.transport)
-        self.service = self.client.service
+        self.transport = rca_client_registry.get_transport()
+        self.client = rca_client_registry.get_client(wsdl_url)
+        self.service = rca_client_registry.get_service(self.client, wsdl_url)
         self.security_token = None
 
     def authenticate(self, username: str = settings.RCA_USERNAME, password: str = settings.RCA_PASSWORD):
@@ -62,6 +284,36 @@ class RcaExportServiceClient:
         response = self.service.CheckAccess(login=login, password=password)
         return response
 
+    def call_with_token(self, operation: str, **kwargs):
+        """
+        Calls a service operation with the shared security token.
+
+        The token is taken from ``rca_token_manager`` instead of authenticating before every call. If the
+        service rejects the token, either with a SOAP fault or with an unsuccessful response, the token is
+        invalidated and the operation is retried once with a fresh one.
+
+        Parameters:
+            operation (str): The name of the service operation, e.g. "CalculateRCAIPremium".
+            **kwargs: The arguments of the operation, without the SecurityToken.
+
+        Returns:
+            The response of the service operation.
+        """
+        method = getattr(self.service, operation)
+        self.security_token = rca_token_manager.get_token(self)
+        try:
+            response = method(SecurityToken=self.security_token, **kwargs)
+        except Fault as e:
+            if not is_token_rejected(e.message):
+                raise
+        else:
+            if not is_token_rejected(self.get_error_message(response)):
+                return response
+
+        rca_token_manager.invalidate(self.security_token)
+        self.security_token = rca_token_manager.get_token(self)
+        return method(SecurityToken=self.security_token, **kwargs)
+
     def calculate_rca(self, request_obj: dict):
         """
         Calculates the RCA insurance premium based on the provided employee and
@@ -92,16 +344,9 @@ class RcaExportServiceClient:
             Raised if the response from the API service indicates failure,
             including an error message returned by the service.
         """
-        Employee = self.client.get_type("ns0:EmployeeInput")(IDNP=settings.ASIG_IDNP)
-
-        RequestType = self.client.get_type("ns0:CalculateRCAIPremiumRequest")
-        request_obj = RequestType(
-            Employee=Employee,
-            **request_obj,
-        )
+        request_obj = self.build_calculate_rca_request(request_obj)
         try:
-            self.authenticate()
-            response = self.service.CalculateRCAIPremium(SecurityToken=self.security_token, request=request_obj)
+            response = self.call_with_token("CalculateRCAIPremium", request=request_obj)
         except Exception as e:  # noqa: BLE001
             raise APIException(detail={"detail": str(e)}) from e
         if response.IsSuccess is False:
@@ -129,16 +374,9 @@ class RcaExportServiceClient:
         Returns:
             Response object from the external service call.
         """
-        Employee = self.client.get_type("ns0:EmployeeInput")(IDNP=settings.ASIG_IDNP)
-
-        RequestType = self.client.get_type("ns0:CalculateRCAEPremiumRequest")
-        request_obj = RequestType(
-            Employee=Employee,
-            **request_obj,
-        )
+        request_obj = self.build_calculate_green_card_request(request_obj)
         try:
-            self.authenticate()
-            response = self.service.CalculateRCAEPremium(SecurityToken=self.security_token, request=request_obj)
+            response = self.call_with_token("CalculateRCAEPremium", request=request_obj)
         except Exception as e:  # noqa: BLE001
             raise APIException(detail={"detail": str(e)}) from e
         if response.IsSuccess is False:
@@ -181,8 +419,7 @@ class RcaExportServiceClient:
         )
 
         try:
-            self.authenticate()
-            response = self.service.SaveGreenCardDocument(SecurityToken=self.security_token, request=document_request)
+            response = self.call_with_token("SaveGreenCardDocument", request=document_request)
         except Exception as e:  # noqa: BLE001
             raise APIException(detail={"detail": str(e)}) from e
         if response.Success is False:
@@ -222,8 +459,7 @@ class RcaExportServiceClient:
         )
 
         try:
-            self.authenticate()
-            response = self.service.SaveRcaDocument(SecurityToken=self.security_token, request=document_request)
+            response = self.call_with_token("SaveRcaDocument", request=document_request)
         except TransportError as e:
             if e.status_code == 200:
                 return e.content
@@ -254,8 +490,7 @@ class RcaExportServiceClient:
         file_request = FileRequestType(DocumentId=DocumentId, DocumentType=DocumentType, ContractType=ContractType)
 
         try:
-            self.authenticate()
-            response = self.service.GetFile(SecurityToken=self.security_token, fileRequest=file_request)
+            response = self.call_with_token("GetFile", fileRequest=file_request)
         except Exception as e:  # noqa: BLE001
             raise APIException(detail={"detail": str(e)}) from e
         if response.IsSuccess is False:
@@ -363,3 +598,74 @@ class RcaExportServiceClient:
         request_obj should be ns0:LastContractExpirationDateRequest with required fields.
         """
         return self.service.GetLastContractExpirationDate(SecurityToken=self.security_token, request=request_obj)
+
+
+class AsyncRcaExportServiceClient(RcaRequestBuilderMixin):
+    """
+    Asynchronous variant of ``RcaExportServiceClient`` for the quote operations.
+
+    Built on zeep's ``AsyncClient`` with the httpx transport of the running event loop, so an ASGI
+    worker can keep many BNM round trips in flight at once. The WSDL document and the security token
+    are shared with the sync client.
+    """
+
+    def __init__(self, wsdl_url=settings.RCA_URL):
+        self.wsdl_url = wsdl_url
+        self.transport = rca_client_registry.get_async_transport()
+        self.client = AsyncClient(wsdl=rca_client_registry.get_document(wsdl_url), transport=self.transport)
+        self.service = rca_client_registry.get_service(self.client, wsdl_url)
+        self.security_token = None
+
+    async def get_security_token(self) -> str:
+        """
+        Returns the shared security token, authenticating in a worker thread if there is none.
+        """
+        # The sync client is built in the worker thread, and only when the token is missing
+        return await sync_to_async(rca_token_manager.get_token, thread_sensitive=False)(
+            functools.partial(RcaExportServiceClient, self.wsdl_url)
+        )
+
+    async def call_with_token(self, operation: str, **kwargs):
+        """
+        Async counterpart of ``RcaExportServiceClient.call_with_token``.
+        """
+        method = getattr(self.service, operation)
+        self.security_token = await self.get_security_token()
+        try:
+            response = await method(SecurityToken=self.security_token, **kwargs)
+        except Fault as e:
+            if not is_token_rejected(e.message):
+                raise
+        else:
+            if not is_token_rejected(self.get_error_message(response)):
+                return response
+
+        await sync_to_async(rca_token_manager.invalidate, thread_sensitive=False)(self.security_token)
+        self.security_token = await self.get_security_token()
+        return await method(SecurityToken=self.security_token, **kwargs)
+
+    async def calculate_rca(self, request_obj: dict):
+        """
+        Async counterpart of ``RcaExportServiceClient.calculate_rca``.
+        """
+        request_obj = self.build_calculate_rca_request(request_obj)
+        try:
+            response = await self.call_with_token("CalculateRCAIPremium", request=request_obj)
+        except Exception as e:  # noqa: BLE001
+            raise APIException(detail={"detail": str(e)}) from e
+        if response.IsSuccess is False:
+            raise ValidationError(detail={"detail": response.ErrorMessage})
+        return response
+
+    async def calculate_green_card(self, request_obj: dict):
+        """
+        Async counterpart of ``RcaExportServiceClient.calculate_green_card``.
+        """
+        request_obj = self.build_calculate_green_card_request(request_obj)
+        try:
+            response = await self.call_with_token("CalculateRCAEPremium", request=request_obj)
+        except Exception as e:  # noqa: BLE001
+            raise APIException(detail={"detail": str(e)}) from e
+        if response.IsSuccess is False:
+            raise ValidationError(detail={"detail": response.ErrorMessage})
+        return response
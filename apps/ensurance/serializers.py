@@ -1,9 +1,12 @@
+import csv
+import io
 from datetime import datetime
 
 from rest_framework import serializers
 
 from apps.ensurance.constants import (
     ContractType,
+    DocumentType,
     GreenCardVehicleCategories,
     GreenCardZones,
     OperationModes,
@@ -30,6 +33,89 @@ class CalculateRCAInputSerializer(serializers.Serializer):
     )
 
 
+class CalculateRCAFleetInputSerializer(serializers.Serializer):
+    MAX_VEHICLES = 500
+
+    OperatingModes = serializers.ChoiceField(choices=OperationModes.choices)
+    PersonIsJuridical = serializers.BooleanField(default=True)
+    IDNX = serializers.CharField(required=True, max_length=13, min_length=13, help_text="IDNP or IDNO")
+    VehicleRegistrationCertificateNumbers = serializers.ListField(
+        child=serializers.CharField(max_length=9, min_length=9),
+        required=False,
+        help_text="Vehicle Registration Certificate Numbers",
+    )
+    File = serializers.FileField(
+        required=False,
+        write_only=True,
+        help_text="CSV file with one Vehicle Registration Certificate Number in the first column of each row",
+    )
+
+    def validate(self, attrs):
+        numbers = list(attrs.get("VehicleRegistrationCertificateNumbers", []))
+        if file := attrs.pop("File", None):
+            reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+            try:
+                numbers.extend(row[0].strip() for row in reader if row and row[0].strip())
+            except (UnicodeDecodeError, csv.Error) as e:
+                raise serializers.ValidationError({"File": f"The file is not a valid UTF-8 CSV file: {e}"}) from e
+
+        # Remove duplicates while keeping the order of the vehicles
+        numbers = list(dict.fromkeys(numbers))
+        if not numbers:
+            raise serializers.ValidationError(
+                {"VehicleRegistrationCertificateNumbers": "At least one vehicle is required."}
+            )
+        if len(numbers) > self.MAX_VEHICLES:
+            raise serializers.ValidationError(
+                {"VehicleRegistrationCertificateNumbers": f"At most {self.MAX_VEHICLES} vehicles are allowed."}
+            )
+        invalid = [number for number in numbers if len(number) != 9]
+        if invalid:
+            raise serializers.ValidationError(
+                {"VehicleRegistrationCertificateNumbers": f"Invalid numbers: {', '.join(invalid)}"}
+            )
+        attrs["VehicleRegistrationCertificateNumbers"] = numbers
+        return attrs
+
+
+class GreenCardCombinationSerializer(serializers.Serializer):
+    GreenCardZone = serializers.ChoiceField(choices=GreenCardZones.choices, required=True)
+    TermInsurance = serializers.ChoiceField(choices=TermInsurance.choices, required=True)
+
+
+class CalculateGreenCardGridInputSerializer(serializers.Serializer):
+    IDNX = serializers.CharField(
+        required=True,
+        help_text="IDNP or IDNO",
+        max_length=13,
+        min_length=13,
+    )
+    VehicleRegistrationCertificateNumber = serializers.CharField(
+        required=True,
+        max_length=9,
+        min_length=9,
+        help_text="Vehicle Registration Certificate Number",
+    )
+    Combinations = GreenCardCombinationSerializer(
+        many=True,
+        required=False,
+        help_text="Zone and term combinations to quote, all of them when omitted",
+    )
+
+    def validate(self, attrs):
+        if not attrs.get("Combinations"):
+            attrs["Combinations"] = [
+                {"GreenCardZone": zone, "TermInsurance": term}
+                for zone in GreenCardZones.values
+                for term in TermInsurance.values
+            ]
+        return attrs
+
+
+class CalculateRCAMatrixInputSerializer(CalculateRCAInputSerializer):
+    OperatingModes = None
+
+
 class CalculateGreenCardInputSerializer(serializers.Serializer):
     GreenCardZone = serializers.ChoiceField(choices=GreenCardZones.choices, required=True)
     TermInsurance = serializers.ChoiceField(choices=TermInsurance.choices, required=True)
@@ -89,6 +175,39 @@ class CalculateRCAOutputSerializer(serializers.Serializer):
     VehicleRegistrationNumber = serializers.CharField(max_length=20)
 
 
+class PrimeSumSerializer(serializers.Serializer):
+    PrimeSum = serializers.DecimalField(max_digits=20, decimal_places=2)
+    PrimeSumMDL = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+
+class InsurerPrimeMatrixSerializer(serializers.Serializer):
+    Name = serializers.CharField(max_length=255)
+    IDNO = serializers.CharField(max_length=13, min_length=13)
+    is_active = serializers.BooleanField(default=True)
+    logo = serializers.URLField(allow_null=True, required=False)
+    Premiums = serializers.DictField(child=PrimeSumSerializer(), help_text="Premiums keyed by operating mode")
+
+
+class CalculateRCAMatrixOutputSerializer(serializers.Serializer):
+    Insurers = InsurerPrimeMatrixSerializer(many=True)
+    Errors = serializers.DictField(child=serializers.JSONField(), help_text="Errors keyed by operating mode")
+    BonusMalusClass = serializers.IntegerField()
+    IsSuccess = serializers.BooleanField()
+    ErrorMessage = serializers.CharField(allow_null=True, required=False)
+    Territory = serializers.CharField(max_length=100)
+    PersonFirstName = serializers.CharField(max_length=100, required=False, default=None, allow_null=True)
+    PersonLastName = serializers.CharField(max_length=100, required=False, default=None, allow_null=True)
+    VehicleMark = serializers.CharField(max_length=100)
+    VehicleModel = serializers.CharField(max_length=100)
+    VehicleRegistrationNumber = serializers.CharField(max_length=20)
+
+
+class FleetQuoteSerializer(serializers.Serializer):
+    VehicleRegistrationCertificateNumber = serializers.CharField(max_length=9, allow_null=True)
+    Quote = CalculateRCAOutputSerializer(allow_null=True)
+    Error = serializers.JSONField(allow_null=True)
+
+
 class CalculateGreenCardOutputSerializer(serializers.Serializer):
     InsurersPrime = InsurersPrimeGreenCardSerializer()
     IsSuccess = serializers.BooleanField()
@@ -103,6 +222,28 @@ class CalculateGreenCardOutputSerializer(serializers.Serializer):
     )
 
 
+class GreenCardGridCellSerializer(serializers.Serializer):
+    Insurers = InsurerPrimeRCAESerializer(many=True)
+    Error = serializers.JSONField(allow_null=True)
+
+
+class CalculateGreenCardGridOutputSerializer(serializers.Serializer):
+    Grid = serializers.DictField(
+        child=serializers.DictField(child=GreenCardGridCellSerializer()),
+        help_text="Cells indexed by zone and term",
+    )
+    IsSuccess = serializers.BooleanField(required=False)
+    ErrorMessage = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    PersonFirstName = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    PersonLastName = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    VehicleMark = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    VehicleModel = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    VehicleRegistrationNumber = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    VehicleCategory = serializers.ChoiceField(
+        allow_null=True, allow_blank=True, required=False, choices=GreenCardVehicleCategories.choices
+    )
+
+
 class CompanyModelSerializer(serializers.Serializer):
     IDNO = serializers.CharField(required=False, allow_blank=True)
 
@@ -220,9 +361,25 @@ class GetFileRequestSerializer(serializers.Serializer):
     ContractType = serializers.ChoiceField(choices=ContractType.choices, required=False, default=ContractType.RCAI)
 
 
+class GetDocumentPartRequestSerializer(GetFileRequestSerializer):
+    DocumentType = serializers.ChoiceField(choices=DocumentType.choices)
+
+
+class DownloadArchiveRequestSerializer(serializers.Serializer):
+    external_ids = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        min_length=1,
+        max_length=20,
+        help_text="DocumentIds of the files to put in the archive",
+    )
+
+
 class SendFileRequestSerializer(serializers.Serializer):
     ContractType = serializers.ChoiceField(choices=ContractType.choices, required=False, default=ContractType.RCAI)
     email = serializers.EmailField(required=True)
+    link = serializers.BooleanField(
+        default=False, help_text="Send a signed download link instead of attaching the file"
+    )
 
 
 class DateStringField(serializers.DateField):
@@ -306,6 +463,21 @@ class DogMEDPHReturnSerializer(DogMEDPHSerializer):
     PrimaTotalaLEI = serializers.FloatField()
 
 
+class DirectoryAutocompleteRequestSerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=100, help_text="Beginning or part of the name")
+    kind = serializers.ChoiceField(
+        choices=[("city", "City"), ("country", "Country")], required=False, help_text="Search a single directory"
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class DirectoryEntrySerializer(serializers.Serializer):
+    uin = serializers.CharField()
+    name = serializers.CharField()
+    kind = serializers.CharField()
+    region_uin = serializers.CharField(allow_null=True)
+
+
 class CalculateRootSerializer(serializers.Serializer):
     DogMEDPH = DogMEDPHSerializer(many=True)
 
@@ -1,24 +1,86 @@
 import base64
+import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from io import BytesIO
+from datetime import timedelta
+from smtplib import SMTPException
 
-import PyPDF2
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import APIException
 
-from apps.ensurance.constants import DocumentType, FileTypes
+from apps.common.cache import cache_lock
+from apps.common.mail import mail_connection
+from apps.ensurance.claims import flag_claim
+from apps.ensurance.constants import (
+    ContractType,
+    DocumentStatus,
+    DocumentType,
+    EmailStatus,
+    FileTypes,
+    PaymentClaimStatus,
+)
+from apps.ensurance.directories import DIRECTORIES_KEY, refresh_directories
+from apps.ensurance.documents import (
+    enqueue_document,
+    get_document_part,
+    get_document_status,
+    get_signed_file_url,
+    set_document_status,
+)
 from apps.ensurance.donaris import MedicinaAPI
-from apps.ensurance.models import File
-from apps.ensurance.rca import RcaExportServiceClient
+from apps.ensurance.models import File, FileEmail, PaymentClaim
+from apps.ensurance.pdf import merge_pdfs
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def download_and_merge_documents(document_id, ContractType: str, data: dict | None = None) -> int:
+
+@shared_task(autoretry_for=(APIException,), max_retries=3, retry_backoff=True)
+def download_and_merge_documents(document_id, ContractType: str) -> int:
     """
     Download three types of documents (CONTRACT, DEMAND, INSURANCE_POLICY)
     for a given document_id in parallel, merge them into one PDF, and store
     them as a single File instance in the database.
+
+    Each part is stored on its own, and failed BNM calls are retried with
+    backoff, downloading only the parts that are still missing.
+
+    Builds are deduplicated per ``(external_id, type)`` with a distributed lock:
+    exactly one caller downloads the documents while concurrent callers wait
+    for it and return the stored file. The build status is published with
+    ``set_document_status`` so that ``get-rca-file`` can tell a pending
+    document from a failed one.
     """
+    if file_obj := File.objects.filter(external_id=document_id).first():
+        return file_obj.id
+
+    file_type = FileTypes.RCA if ContractType == "RCAI" else FileTypes.GREEN_CARD
+    timeout = settings.RCA_DOCUMENT_BUILD_TIMEOUT
+    with cache_lock(
+        f"rca:document-build:{file_type}:{document_id}", timeout=timeout, blocking_timeout=timeout
+    ) as acquired:
+        # The document may have been built while waiting for the lock
+        if file_obj := File.objects.filter(external_id=document_id).first():
+            return file_obj.id
+        if not acquired:
+            raise TimeoutError(f"Document {document_id} is still being built by another worker.")
+
+        set_document_status(document_id, ContractType, DocumentStatus.PROCESSING)
+        try:
+            file_id = merge_documents(document_id, ContractType)
+        except Exception:
+            set_document_status(document_id, ContractType, DocumentStatus.FAILED)
+            raise
+        set_document_status(document_id, ContractType, DocumentStatus.READY)
+        return file_id
+
+
+def merge_documents(document_id, ContractType: str) -> int:
     # The DocumentTypes you want to fetch and merge
     doc_types = [
         DocumentType.CONTRACT,
@@ -26,44 +88,18 @@ def download_and_merge_documents(document_id, ContractType: str, data: dict | No
         DocumentType.INSURANCE_POLICY,
     ]
 
-    # Helper function to download and process a single document
-    def fetch_and_process(doc_type):
-        response = RcaExportServiceClient().get_file(
-            DocumentId=document_id,
-            DocumentType=doc_type,
-            ContractType=ContractType,
-        )
-        # Insert your watermark/image here
-        # processed_pdf_content = insert_image_into_pdf(response.FileContent)
-        return doc_type, response.FileContent
-
-    # Download all documents in parallel using a thread pool
+    # Get all documents in parallel using a thread pool. Every part is stored on its own as soon as it is
+    # downloaded, so a retry after a failed part only downloads the missing ones.
     results = {}
     with ThreadPoolExecutor(max_workers=len(doc_types)) as executor:
-        future_to_doc_type = {executor.submit(fetch_and_process, dt): dt for dt in doc_types}
+        future_to_doc_type = {executor.submit(get_document_part, document_id, ContractType, dt): dt for dt in doc_types}
         for future in as_completed(future_to_doc_type):
-            doc_type = future_to_doc_type[future]
-            # future.result() returns (doc_type, processed_pdf_content)
-            _, processed_pdf_content = future.result()
-            results[doc_type] = processed_pdf_content
-
-    # Initialize a PDF writer to collect/merge pages
-    pdf_writer = PyPDF2.PdfWriter()
-
-    # Merge the downloaded PDFs in the specified order
-    for dt in doc_types:
-        processed_pdf_content = results[dt]
-        pdf_reader = PyPDF2.PdfReader(BytesIO(processed_pdf_content))
-        for page in pdf_reader.pages:
-            pdf_writer.add_page(page)
-
-    # Now, write out the merged PDF to a BytesIO buffer
-    merged_stream = BytesIO()
-    pdf_writer.write(merged_stream)
-    merged_stream.seek(0)  # reset to the beginning
+            results[future_to_doc_type[future]] = future.result()
+
+    # Merge the downloaded PDFs in the specified order, stamping the last page of each one in the same pass
+    file_content = merge_pdfs((results[dt] for dt in doc_types), stamp=settings.PDF_STAMP_DOCUMENTS)
 
     # Create a Django File object from the merged PDF
-    file_content = merged_stream.getvalue()
     merged_file = SimpleUploadedFile(
         f"{document_id}_merged.pdf",
         file_content,
@@ -107,20 +143,10 @@ def download_insurance_policy(document_id) -> int:
     if not files_content:
         raise ValueError("No files found in the response.")
 
-    # Extract files, merge them, and save
-    pdf_writer = PyPDF2.PdfWriter()
-    for file_content in files_content:
-        # Assuming file_content is a base64 string in field "BASE64Str"
-        pdf_reader = PyPDF2.PdfReader(BytesIO(base64.b64decode(file_content["BASE64Str"])))
-        for page in pdf_reader.pages:
-            pdf_writer.add_page(page)
-    # Now, write out the merged PDF to a BytesIO buffer
-    merged_stream = BytesIO()
-    pdf_writer.write(merged_stream)
-    merged_stream.seek(0)
+    # Extract files and merge them, the content is a base64 string in field "BASE64Str"
+    file_content = merge_pdfs(base64.b64decode(file_content["BASE64Str"]) for file_content in files_content)
 
     # Create a Django File object from the merged PDF
-    file_content = merged_stream.getvalue()
     insurance_policy_file = SimpleUploadedFile(
         f"{document_id}_insurance_policy.pdf",
         file_content,
@@ -135,3 +161,165 @@ def download_insurance_policy(document_id) -> int:
     )
 
     return file_obj.id
+
+
+@shared_task
+def recover_payment_claims() -> dict:
+    """
+    Recover the payment claims left behind by interrupted saves.
+
+    Claims still pending after ``PAYMENT_CLAIM_TIMEOUT`` belong to a save that was interrupted without
+    reaching ``release_claim``, so BNM or Donaris may have accepted the document. They are moved to manual
+    review with their payment still used, and released from the admin once nothing was saved upstream.
+    Saved RCA or Green Card claims whose merged document was never built are enqueued again.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.PAYMENT_CLAIM_TIMEOUT)
+
+    flagged = 0
+    for claim in PaymentClaim.objects.filter(status=PaymentClaimStatus.CLAIMED, updated_at__lt=stale_before):
+        flagged += flag_claim(claim, "The save was interrupted, check whether the document exists upstream.")
+
+    contract_types = {FileTypes.RCA: ContractType.RCAI, FileTypes.GREEN_CARD: ContractType.CV}
+    saved_claims = PaymentClaim.objects.filter(
+        status=PaymentClaimStatus.SAVED,
+        type__in=contract_types,
+        updated_at__lt=stale_before,
+        updated_at__gte=now - timedelta(seconds=settings.RCA_DOCUMENT_STATUS_TTL),
+    )
+    built = set(
+        File.objects.filter(external_id__in=[claim.external_id for claim in saved_claims]).values_list(
+            "external_id", flat=True
+        )
+    )
+
+    enqueued = 0
+    for claim in saved_claims:
+        if claim.external_id in built:
+            continue
+        contract_type = contract_types[claim.type]
+        if get_document_status(claim.external_id, contract_type) in (None, DocumentStatus.FAILED):
+            enqueue_document(claim.external_id, contract_type)
+            enqueued += 1
+
+    return {"flagged": flagged, "enqueued": enqueued}
+
+
+def queue_file_email(external_id, email: str, contract_type: str = ContractType.RCAI, link: bool = False) -> FileEmail:
+    """
+    Queues a stored file to be sent by email with the next batch.
+
+    The first email queued schedules a batch ``EMAIL_BATCH_DELAY`` seconds later, so the emails queued in the
+    meantime are all sent by that run over one SMTP connection.
+    """
+    file_email = FileEmail.objects.create(external_id=external_id, contract_type=contract_type, email=email, link=link)
+    if cache.add("mail:batch-scheduled", True, timeout=settings.EMAIL_BATCH_DELAY):
+        transaction.on_commit(lambda: send_queued_emails.apply_async(countdown=settings.EMAIL_BATCH_DELAY))
+    return file_email
+
+
+def build_file_email(file_email: FileEmail) -> EmailMultiAlternatives | None:
+    """
+    Builds the message of a queued email, or returns ``None`` and enqueues the document build if the file
+    does not exist yet.
+    """
+    file = File.objects.filter(external_id=file_email.external_id).first()
+    if not file:
+        if get_document_status(file_email.external_id, file_email.contract_type) in (None, DocumentStatus.FAILED):
+            enqueue_document(file_email.external_id, file_email.contract_type)
+        return None
+
+    if file_email.link:
+        return EmailMultiAlternatives(
+            subject=_("Your file"),
+            body=_("Download your file: %(url)s") % {"url": get_signed_file_url(file_email.external_id)},
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[file_email.email],
+        )
+
+    message = EmailMultiAlternatives(
+        subject=_("Your file"),
+        body=_("Please find the attached file."),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[file_email.email],
+    )
+    with file.file.open("rb") as content:
+        message.attach(file.file.name, content.read(), "application/pdf")
+    return message
+
+
+def defer_file_email(file_email: FileEmail, error: str) -> None:
+    """
+    Schedules the next attempt of a queued email with an exponential backoff, or gives up after
+    ``EMAIL_MAX_ATTEMPTS`` attempts.
+    """
+    attempts = file_email.attempts + 1
+    FileEmail.objects.filter(pk=file_email.pk).update(
+        status=EmailStatus.FAILED if attempts >= settings.EMAIL_MAX_ATTEMPTS else EmailStatus.PENDING,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=min(60 * 2 ** (attempts - 1), 10 * 60)),
+        error=error,
+        updated_at=timezone.now(),
+    )
+
+
+@shared_task
+def send_queued_emails() -> dict:
+    """
+    Sends the queued ``send-file`` emails that are due, up to ``EMAIL_BATCH_SIZE`` per run, over the mail
+    connection pooled by the worker.
+
+    Each email is marked as sent as soon as its own message has gone out, so a failure only delays the
+    emails that were not sent: they are retried with a backoff by a later run. A cache lock keeps two runs
+    from sending the same emails.
+    """
+    with cache_lock("mail:send-queued-emails", timeout=settings.CELERY_TASK_TIME_LIMIT, blocking_timeout=0) as acquired:
+        if not acquired:
+            return {"skipped": True}
+
+        pending = FileEmail.objects.filter(status=EmailStatus.PENDING, next_attempt_at__lte=timezone.now())
+        batch = list(pending.order_by("next_attempt_at")[: settings.EMAIL_BATCH_SIZE])
+
+        sent = deferred = 0
+        for file_email in batch:
+            try:
+                message = build_file_email(file_email)
+            except Exception as e:  # noqa: BLE001 - storage errors (S3Error, MaxRetryError) are not OSErrors
+                # An unreadable file only defers its own email instead of aborting the batch
+                logger.exception("Could not build the queued email %s", file_email.pk)
+                defer_file_email(file_email, str(e))
+                deferred += 1
+                continue
+            if message is None:
+                defer_file_email(file_email, "The document is not built yet.")
+                deferred += 1
+                continue
+
+            try:
+                mail_connection.send_messages([message])
+            except (SMTPException, OSError) as e:
+                # The connection may be broken, the next message opens a new one
+                mail_connection.close()
+                defer_file_email(file_email, str(e))
+                deferred += 1
+                continue
+            FileEmail.objects.filter(pk=file_email.pk).update(
+                status=EmailStatus.SENT, attempts=file_email.attempts + 1, error=None, updated_at=timezone.now()
+            )
+            sent += 1
+
+        # Emails left over by a full batch go out with the next run right away
+        if len(batch) == settings.EMAIL_BATCH_SIZE and pending.exists():
+            send_queued_emails.delay()
+        return {"sent": sent, "deferred": deferred}
+
+
+@shared_task
+def refresh_medicina_directories() -> list[str]:
+    """
+    Refresh the snapshot of the Donaris directories served by ``get-medical-insurance-constants``.
+    """
+    try:
+        return sorted(refresh_directories()["data"])
+    finally:
+        cache.delete(f"{DIRECTORIES_KEY}:refreshing")
@@ -1,12 +1,23 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from apps.ensurance.views import MedicalInsuranceViewSet, RcaViewSet
+from apps.ensurance.views import (
+    AsyncCalculateGreenCardView,
+    AsyncCalculateRcaView,
+    MedicalInsuranceViewSet,
+    RcaViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"rca", RcaViewSet, basename="rca")
 router.register(r"medical-insurance", MedicalInsuranceViewSet, basename="medical-insurance")
 
 urlpatterns = [
+    path("rca/async/calculate-rca/", AsyncCalculateRcaView.as_view(), name="rca-async-calculate-rca"),
+    path(
+        "rca/async/calculate-green-card/",
+        AsyncCalculateGreenCardView.as_view(),
+        name="rca-async-calculate-green-card",
+    ),
     path("", include(router.urls)),
 ]
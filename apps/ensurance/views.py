@@ -1,27 +1,65 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.templatetags.static import static
-from django.utils.translation import gettext as _
 from drf_spectacular.utils import OpenApiResponse, extend_schema
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
-from zeep.helpers import serialize_object
 
-from apps.ensurance.constants import ContractType
+from apps.ensurance.claims import claim_payment, complete_claim, settle_failed_claim
+from apps.ensurance.constants import ContractType, DocumentStatus, FileTypes
+from apps.ensurance.delivery import serve_archive, serve_file, serve_object
+from apps.ensurance.directories import get_directories
+from apps.ensurance.directory_index import get_directory_index
+from apps.ensurance.documents import (
+    enqueue_document,
+    get_document_part_name,
+    get_document_part_storage,
+    get_document_status,
+    store_document_part,
+    unsign_file_token,
+    wait_for_document,
+)
 from apps.ensurance.donaris import MedicinaAPI
+from apps.ensurance.helpers import link_rca_companies
 from apps.ensurance.models import File, MedicalInsuranceCompany, RCACompany
-from apps.ensurance.rca import RcaExportServiceClient
+from apps.ensurance.quotes import (
+    aget_quote,
+    get_green_card_quote,
+    get_green_card_quote_grid,
+    get_medical_tariff,
+    get_rca_quote,
+    get_rca_quote_matrix,
+    green_card_quote_cache,
+    iter_rca_fleet_quotes,
+    rca_quote_cache,
+)
+from apps.ensurance.rca import AsyncRcaExportServiceClient, RcaExportServiceClient
 from apps.ensurance.serializers import (
+    CalculateGreenCardGridInputSerializer,
+    CalculateGreenCardGridOutputSerializer,
     CalculateGreenCardInputSerializer,
     CalculateGreenCardOutputSerializer,
+    CalculateRCAFleetInputSerializer,
     CalculateRCAInputSerializer,
+    CalculateRCAMatrixInputSerializer,
+    CalculateRCAMatrixOutputSerializer,
     CalculateRCAOutputSerializer,
     CalculateRootSerializer,
+    DirectoryAutocompleteRequestSerializer,
+    DirectoryEntrySerializer,
+    DownloadArchiveRequestSerializer,
+    FleetQuoteSerializer,
+    GetDocumentPartRequestSerializer,
     GetFileRequestSerializer,
     GreenCardDocumentModelSerializer,
     RootReturnSerializer,
@@ -29,7 +67,7 @@ from apps.ensurance.serializers import (
     SaveRcaDocumentSerializer,
     SendFileRequestSerializer,
 )
-from apps.ensurance.tasks import download_and_merge_documents, download_insurance_policy
+from apps.ensurance.tasks import download_insurance_policy, queue_file_email
 
 
 class RcaViewSet(GenericViewSet):
@@ -77,28 +115,106 @@ class RcaViewSet(GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # Call the SOAP method
-        response = RcaExportServiceClient().calculate_rca(serializer.validated_data)
+        # Get the serialized quote from the cache or the SOAP method
+        response = get_rca_quote(RcaExportServiceClient(), serializer.validated_data)
+
+        # Get settings for RCA companies and link them to the response
+        insurers_prime = response["InsurersPrime"]
+        insurers_prime["InsurerPrimeRCAI"] = link_rca_companies(insurers_prime["InsurerPrimeRCAI"])
+        return Response(response, status=status.HTTP_200_OK)
+
+    @extend_schema(responses={200: CalculateRCAMatrixOutputSerializer})
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="calculate-rca-matrix",
+        serializer_class=CalculateRCAMatrixInputSerializer,
+    )
+    def calculate_rca_matrix(self, request):
+        """
+        Calculates the RCA premiums for all operating modes in a single request.
+
+        The five ``CalculateRCAIPremium`` calls run concurrently over one security token, and the
+        premiums are grouped per insurer, so the client can switch between operating modes without
+        another round trip. Operating modes rejected by the service are listed in ``Errors``.
+
+        Parameters:
+            request (Request): The HTTP request with the person and vehicle data, without OperatingModes.
+
+        Returns:
+            Response: The insurers with their premiums keyed by operating mode, with a status of 200 OK.
+        """
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Get the quotes of all operating modes
+        response = get_rca_quote_matrix(serializer.validated_data)
 
         # Get settings for RCA companies and link them to the response
-        rca_companies = RCACompany.objects.all()
-        rca_companies = {company.idno: company for company in rca_companies}
-
-        for insurer in response.InsurersPrime.InsurerPrimeRCAI:
-            company = rca_companies.get(insurer.IDNO)
-            if not company:
-                company = RCACompany.objects.create(
-                    name=insurer.Name, idno=insurer.IDNO, is_active=True, is_public=True
-                )
-            if not company.is_public:
-                response.InsurersPrime.InsurerPrimeRCAI.remove(insurer)
-            insurer["is_active"] = company.is_active if company else False
-            insurer["logo"] = company.logo.url if company.logo else static("public/default-logo.png")
-
-        # Validate and serialize the response
-        output_serializer = CalculateRCAOutputSerializer(data=serialize_object(response))
-        output_serializer.is_valid(raise_exception=True)
-        return Response(output_serializer.data, status=status.HTTP_200_OK)
+        response["Insurers"] = link_rca_companies(response["Insurers"])
+        return Response(response, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                response=FleetQuoteSerializer,
+                description=(
+                    "NDJSON stream with one quote per vehicle, in completion order. If the stream is interrupted, "
+                    "the last line has no VehicleRegistrationCertificateNumber and carries the Error."
+                ),
+            )
+        }
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="calculate-rca-fleet",
+        serializer_class=CalculateRCAFleetInputSerializer,
+    )
+    def calculate_rca_fleet(self, request):
+        """
+        Calculates the RCA premiums of a fleet of vehicles and streams them back as NDJSON.
+
+        The vehicles are given as a JSON list of registration certificate numbers or as an uploaded
+        CSV file. The ``CalculateRCAIPremium`` calls run concurrently in a bounded pool over one
+        security token, and each vehicle is written as a JSON line as soon as its quote finishes. The token is
+        obtained before the response starts, and an unexpected failure afterwards ends the stream with an
+        ``Error`` line without a vehicle.
+
+        Parameters:
+            request (Request): The HTTP request with the owner, the operating mode and the vehicles.
+
+        Returns:
+            StreamingHttpResponse: An ``application/x-ndjson`` stream of quotes, with a status of 200 OK.
+        """
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Authenticate before the 200 status is sent, so a failure is still reported as an error response
+        quotes = iter_rca_fleet_quotes(serializer.validated_data)
+        rca_companies = {company.idno: company for company in RCACompany.objects.all()}
+
+        def stream():
+            try:
+                for number, quote, error in quotes:
+                    if quote:
+                        insurers_prime = quote["InsurersPrime"]
+                        insurers_prime["InsurerPrimeRCAI"] = link_rca_companies(
+                            insurers_prime["InsurerPrimeRCAI"], rca_companies
+                        )
+                    line = {"VehicleRegistrationCertificateNumber": number, "Quote": quote, "Error": error}
+                    yield json.dumps(line, cls=DjangoJSONEncoder) + "\n"
+            except Exception as e:  # noqa: BLE001
+                # The status is already sent, a last line tells the client that the stream is incomplete
+                error = {"detail": f"The stream was interrupted: {e}"}
+                line = {"VehicleRegistrationCertificateNumber": None, "Quote": None, "Error": error}
+                yield json.dumps(line, cls=DjangoJSONEncoder) + "\n"
+
+        response = StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+        response["X-Accel-Buffering"] = "no"
+        return response
 
     @extend_schema(responses={200: Serializer})
     @action(
@@ -122,50 +238,50 @@ class RcaViewSet(GenericViewSet):
         Raises:
             ValidationError: If the input data is invalid or no valid payment is provided.
         """
-        with transaction.atomic():
-            # Validate input data
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-
-            operating_modes = serializer.validated_data.pop("OperatingModes")
-
-            operating_modes_strings = {
-                "1": "Usual",
-                "2": "Minibus",
-                "3": "IntercityBus",
-                "4": "Taxi",
-                "5": "RentACar",
-            }
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        operating_modes = serializer.validated_data.pop("OperatingModes")
 
-            # Handle payment method (either QR code or MAIB payment)
-            payment_date = None
-            if "qrCode" in serializer.validated_data:
-                qr_code = serializer.validated_data.pop("qrCode")
-                qr_code.is_used = True
-                qr_code.save()
-                payment_date = qr_code.updated_at.date()
-            elif "maibPayment" in serializer.validated_data:
-                maib_payment = serializer.validated_data.pop("maibPayment")
-                maib_payment.is_used = True
-                maib_payment.save()
-                payment_date = maib_payment.updated_at.date()
-
-            serializer.validated_data["PaymentDate"] = payment_date
-            serializer.validated_data["OperatingMode"] = operating_modes_strings[str(operating_modes)]
-
-            # Call the SOAP method
+        operating_modes_strings = {
+            "1": "Usual",
+            "2": "Minibus",
+            "3": "IntercityBus",
+            "4": "Taxi",
+            "5": "RentACar",
+        }
+
+        # Claim the payment method (either QR code or MAIB payment)
+        claim = claim_payment(
+            FileTypes.RCA,
+            qr_code=serializer.validated_data.pop("qrCode", None),
+            maib_payment=serializer.validated_data.pop("maibPayment", None),
+        )
+
+        serializer.validated_data["PaymentDate"] = claim.created_at.date()
+        serializer.validated_data["OperatingMode"] = operating_modes_strings[str(operating_modes)]
+
+        # Call the SOAP method outside of any transaction, settling the claim if it fails
+        try:
             response = RcaExportServiceClient().save_rca_document(serializer.validated_data)
-            document_id = response.Response["Id"]
-            download_and_merge_documents(
-                document_id, ContractType.RCAI, data=serialize_object(response, target_cls=dict)
-            )
-            return Response(
-                {
-                    "DocumentId": document_id,
-                    "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/?ContractType=RCAI",
-                },
-                status=status.HTTP_200_OK,
-            )
+        except Exception as e:
+            settle_failed_claim(claim, e)
+            raise
+        document_id = response.Response["Id"]
+
+        # Build the merged document in Celery once the claim is completed
+        with transaction.atomic():
+            complete_claim(claim, document_id)
+            document_status = enqueue_document(document_id, ContractType.RCAI)
+        return Response(
+            {
+                "DocumentId": document_id,
+                "status": document_status,
+                "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/?ContractType=RCAI",
+            },
+            status=status.HTTP_200_OK,
+        )
 
     @extend_schema(responses={200: CalculateGreenCardOutputSerializer})
     @action(
@@ -192,27 +308,48 @@ class RcaViewSet(GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # Call the SOAP method
-        response = RcaExportServiceClient().calculate_green_card(serializer.validated_data)
+        # Get the serialized quote from the cache or the SOAP method
+        response = get_green_card_quote(RcaExportServiceClient(), serializer.validated_data)
 
         # Get settings for RCA companies and link them to the response
-        rca_companies = RCACompany.objects.all()
-        rca_companies = {company.idno: company for company in rca_companies}
-
-        for insurer in response.InsurersPrime.InsurerPrimeRCAE:
-            company = rca_companies.get(insurer.IDNO)
-            if not company:
-                company = RCACompany.objects.create(
-                    name=insurer.Name, idno=insurer.IDNO, is_active=True, is_public=True
-                )
-            if not company.is_public:
-                response.InsurersPrime.InsurerPrimeRCAE.remove(insurer)
-            insurer["is_active"] = company.is_active if company else False
-            insurer["logo"] = company.logo.url if company.logo else static("public/default-logo.png")
-
-        output_serializer = CalculateGreenCardOutputSerializer(data=serialize_object(response))
-        output_serializer.is_valid(raise_exception=True)
-        return Response(output_serializer.data, status=status.HTTP_200_OK)
+        insurers_prime = response["InsurersPrime"]
+        insurers_prime["InsurerPrimeRCAE"] = link_rca_companies(insurers_prime["InsurerPrimeRCAE"])
+        return Response(response, status=status.HTTP_200_OK)
+
+    @extend_schema(responses={200: CalculateGreenCardGridOutputSerializer})
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="calculate-green-card-grid",
+        serializer_class=CalculateGreenCardGridInputSerializer,
+    )
+    def calculate_green_card_grid(self, request):
+        """
+        Calculates the Green Card premiums for several zone and term combinations in a single request.
+
+        The ``CalculateRCAEPremium`` calls run concurrently in a bounded pool over one security token.
+        Every cell of the grid holds its insurers or its own error, so a rejected combination does not
+        fail the whole batch.
+
+        Parameters:
+            request (Request): The HTTP request with the person and vehicle data and the combinations.
+
+        Returns:
+            Response: The grid of quotes indexed by zone and term, with a status of 200 OK.
+        """
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Get the quotes of all combinations
+        response = get_green_card_quote_grid(serializer.validated_data)
+
+        # Get settings for RCA companies and link them to the response, loading the companies once for all cells
+        rca_companies = {company.idno: company for company in RCACompany.objects.all()}
+        for cells in response["Grid"].values():
+            for cell in cells.values():
+                cell["Insurers"] = link_rca_companies(cell["Insurers"], rca_companies)
+        return Response(response, status=status.HTTP_200_OK)
 
     @extend_schema(responses={200: Serializer})
     @action(
@@ -244,39 +381,39 @@ class RcaViewSet(GenericViewSet):
                 serializer schema or no valid payment method is provided.
         """
 
-        with transaction.atomic():
-            # Validate input data
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-
-            # Handle payment method (either QR code or MAIB payment)
-            payment_date = None
-            if "qrCode" in serializer.validated_data:
-                qr_code = serializer.validated_data.pop("qrCode")
-                qr_code.is_used = True
-                qr_code.save()
-                payment_date = qr_code.updated_at
-            elif "maibPayment" in serializer.validated_data:
-                maib_payment = serializer.validated_data.pop("maibPayment")
-                maib_payment.is_used = True
-                maib_payment.save()
-                payment_date = maib_payment.updated_at
-
-            serializer.validated_data["PaymentDate"] = payment_date
-
-            # Call the SOAP method
-            response = RcaExportServiceClient().save_greencard_document(serializer.validated_data)
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-            document_id = response.Response["Id"]
-            download_and_merge_documents(document_id, ContractType.CV, data=serialize_object(response))
+        # Claim the payment method (either QR code or MAIB payment)
+        claim = claim_payment(
+            FileTypes.GREEN_CARD,
+            qr_code=serializer.validated_data.pop("qrCode", None),
+            maib_payment=serializer.validated_data.pop("maibPayment", None),
+        )
 
-            return Response(
-                {
-                    "DocumentId": document_id,
-                    "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/?ContractType=CV",
-                },
-                status=status.HTTP_200_OK,
-            )
+        serializer.validated_data["PaymentDate"] = claim.created_at
+
+        # Call the SOAP method outside of any transaction, settling the claim if it fails
+        try:
+            response = RcaExportServiceClient().save_greencard_document(serializer.validated_data)
+        except Exception as e:
+            settle_failed_claim(claim, e)
+            raise
+        document_id = response.Response["Id"]
+
+        # Build the merged document in Celery once the claim is completed
+        with transaction.atomic():
+            complete_claim(claim, document_id)
+            document_status = enqueue_document(document_id, ContractType.CV)
+        return Response(
+            {
+                "DocumentId": document_id,
+                "status": document_status,
+                "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/?ContractType=CV",
+            },
+            status=status.HTTP_200_OK,
+        )
 
     @extend_schema(
         parameters=[GetFileRequestSerializer],
@@ -284,7 +421,8 @@ class RcaViewSet(GenericViewSet):
             200: OpenApiResponse(
                 description="RCA PDF file retrieved successfully.",
                 response=HttpResponse(content_type="application/pdf"),
-            )
+            ),
+            202: OpenApiResponse(description="The RCA PDF file is still being generated."),
         },
     )
     @action(
@@ -307,19 +445,107 @@ class RcaViewSet(GenericViewSet):
 
         Returns:
             HttpResponse: An HTTP response containing the modified PDF file with a content type of
-            application/pdf.
+            application/pdf, or a 202 Accepted response with the document status while the file
+            is still being generated by Celery.
         """
         serializer = self.get_serializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
+        contract_type = serializer.validated_data["ContractType"]
 
         file = File.objects.filter(external_id=pk).first()
         if file:
-            return HttpResponse(file.file.read(), content_type="application/pdf")
+            return serve_file(request, file)
 
-        download_and_merge_documents(pk, serializer.validated_data["ContractType"])
-        file = File.objects.filter(external_id=pk).first()
-        return HttpResponse(file.file.read(), content_type="application/pdf")
+        # Schedule the build if it was never requested or has failed
+        document_status = get_document_status(pk, contract_type)
+        if document_status in (None, DocumentStatus.FAILED):
+            document_status = enqueue_document(pk, contract_type)
+
+        file = wait_for_document(pk)
+        if file:
+            return serve_file(request, file)
+        return Response({"DocumentId": pk, "status": document_status}, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        parameters=[GetDocumentPartRequestSerializer],
+        responses={
+            200: OpenApiResponse(
+                description="Document part retrieved successfully.",
+                response=HttpResponse(content_type="application/pdf"),
+            )
+        },
+    )
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="get-document-part",
+        serializer_class=GetDocumentPartRequestSerializer,
+    )
+    def get_document_part(self, request, pk: str):
+        """
+        Retrieves a single part (contract, demand or insurance policy) of an RCA or Green Card document.
+
+        The part is served from storage, and downloaded with ``GetFile`` only if it was not stored by a
+        previous request or document build. No merge is done.
+
+        Args:
+            request: The HTTP request object containing the ContractType and DocumentType query parameters.
+            pk (str): The DocumentId of the document.
+
+        Returns:
+            HttpResponse: An HTTP response delivering the PDF part.
+        """
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        contract_type = serializer.validated_data["ContractType"]
+        document_type = serializer.validated_data["DocumentType"]
+
+        storage = get_document_part_storage()
+        name = get_document_part_name(pk, contract_type, document_type)
+        if not storage.exists(name):
+            store_document_part(pk, contract_type, document_type)
+        return serve_object(request, storage, name, f"{pk}_{document_type}.pdf")
+
+    @extend_schema(
+        parameters=[DownloadArchiveRequestSerializer],
+        responses={
+            200: OpenApiResponse(
+                description="ZIP archive of the files, streamed while it is built.",
+                response=HttpResponse(content_type="application/zip"),
+            )
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="download-archive",
+        serializer_class=DownloadArchiveRequestSerializer,
+    )
+    def download_archive(self, request):
+        """
+        Downloads several stored files (e.g. the RCA, Green Card and medical policies of one order) as a ZIP archive.
+
+        The archive is built on the fly from the MinIO objects and streamed to the client, so the worker never
+        holds more than one chunk of one file in memory and no temporary file is written.
+
+        Args:
+            request: The HTTP request object with one ``external_ids`` query parameter per file.
+
+        Returns:
+            StreamingHttpResponse: The ZIP archive, or a 404 response if one of the files does not exist.
+        """
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        external_ids = list(dict.fromkeys(serializer.validated_data["external_ids"]))
 
+        files = File.objects.in_bulk(external_ids, field_name="external_id")
+        missing = [external_id for external_id in external_ids if external_id not in files]
+        if missing:
+            return Response({"detail": f"Files not found: {', '.join(missing)}."}, status=status.HTTP_404_NOT_FOUND)
+
+        return serve_archive([files[external_id] for external_id in external_ids])
+
+    @extend_schema(responses={202: OpenApiResponse(description="The email has been queued.")})
     @action(
         detail=True,
         methods=["post"],
@@ -330,37 +556,149 @@ class RcaViewSet(GenericViewSet):
         """
         Sends a file to the user by email.
 
-        This method validates the incoming request data, fetches the file from the database, and sends it to the user
-        via email. The file is attached to the email, and the user is notified about the successful operation.
+        This method validates the incoming request data and queues the email. Celery builds the file if
+        needed and sends the queued emails in batches over a pooled SMTP connection, retrying transient
+        failures. The file is attached to the email, or replaced by a signed download link when ``link`` is set.
 
         Parameters:
             request: The HTTP request object containing the data required for sending the file.
             pk: The primary key of the file to be sent.
 
         Returns:
-            Response: An HTTP response indicating the status of the operation.
+            Response: An HTTP response indicating that the email has been queued.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        file = File.objects.filter(external_id=pk).first()
+        queue_file_email(
+            pk,
+            serializer.validated_data["email"],
+            serializer.validated_data["ContractType"],
+            link=serializer.validated_data["link"],
+        )
+
+        return Response({"detail": "File will be sent shortly."}, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                description="File retrieved successfully.",
+                response=HttpResponse(content_type="application/pdf"),
+            )
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"signed-file/(?P<token>[^/]+)",
+    )
+    def signed_file(self, request, token: str):
+        """
+        Downloads a file through the signed link sent by ``send-file``.
+
+        Args:
+            request: The HTTP request object.
+            token (str): The signed ``external_id`` of the file.
+
+        Returns:
+            HttpResponse: An HTTP response delivering the file, or a 404 response if the link is invalid or
+            has expired.
+        """
+        try:
+            external_id = unsign_file_token(token)
+        except signing.BadSignature:
+            return Response({"detail": "The link is invalid or has expired."}, status=status.HTTP_404_NOT_FOUND)
+
+        file = File.objects.filter(external_id=external_id).first()
         if not file:
-            download_and_merge_documents(pk, serializer.validated_data["ContractType"])
-            file = File.objects.filter(external_id=pk).first()
-            if not file:
-                return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Send the file to the user by email
-        message = EmailMultiAlternatives(
-            subject=_("Your file"),
-            body=_("Please find the attached file."),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[serializer.validated_data["email"]],
+            return Response({"detail": "File not found."}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, file)
+
+
+class AsyncCalculateRcaView(APIView):
+    """
+    Async version of ``RcaViewSet.calculate_rca``.
+
+    The BNM round trip is awaited on the event loop instead of blocking a worker, so under an ASGI
+    server a single worker can hold many pending quotes. The input, output and company settings are
+    the same as for the sync action, and so are the authentication, permissions, throttling, parsing
+    and exception handling, which run through the usual DRF ``initial`` and ``handle_exception`` steps.
+    """
+
+    permission_classes = []
+    authentication_classes = []
+    http_method_names = ["post"]
+    input_serializer_class = CalculateRCAInputSerializer
+    output_serializer_class = CalculateRCAOutputSerializer
+    quote_cache = rca_quote_cache
+    operation = "calculate_rca"
+    insurers_key = "InsurerPrimeRCAI"
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Async counterpart of ``APIView.dispatch``, which only supports sync handlers.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttles may hit the database or the cache
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:  # noqa: BLE001 - handle_exception re-raises what it cannot map
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    @extend_schema(request=CalculateRCAInputSerializer, responses={200: CalculateRCAOutputSerializer})
+    async def post(self, request):
+        """
+        Performs the RCA calculation without blocking the worker while waiting for the SOAP service.
+
+        Parameters:
+            request (Request): The HTTP request carrying the serialized input data.
+
+        Returns:
+            Response: An HTTP response containing the serialized quote with a status of 200 OK.
+        """
+        # Validate input data
+        serializer = self.input_serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Get the serialized quote from the cache or the SOAP method
+        calculate = getattr(AsyncRcaExportServiceClient(), self.operation)
+        response = await aget_quote(
+            self.quote_cache, calculate, self.output_serializer_class, serializer.validated_data
         )
-        message.attach(file.file.name, file.file.read(), "application/pdf")
-        message.send()
 
-        return Response({"detail": "File sent successfully."}, status=status.HTTP_200_OK)
+        # Get settings for RCA companies and link them to the response
+        insurers_prime = response["InsurersPrime"]
+        insurers_prime[self.insurers_key] = await sync_to_async(link_rca_companies)(insurers_prime[self.insurers_key])
+        return Response(response, status=status.HTTP_200_OK)
+
+
+class AsyncCalculateGreenCardView(AsyncCalculateRcaView):
+    """
+    Async version of ``RcaViewSet.calculate_green_card``.
+    """
+
+    input_serializer_class = CalculateGreenCardInputSerializer
+    output_serializer_class = CalculateGreenCardOutputSerializer
+    quote_cache = green_card_quote_cache
+    operation = "calculate_green_card"
+    insurers_key = "InsurerPrimeRCAE"
+
+    @extend_schema(request=CalculateGreenCardInputSerializer, responses={200: CalculateGreenCardOutputSerializer})
+    async def post(self, request):
+        """
+        Performs the Green Card calculation without blocking the worker while waiting for the SOAP service.
+        """
+        return await super().post(request)
 
 
 class MedicalInsuranceViewSet(GenericViewSet):
@@ -409,9 +747,37 @@ class MedicalInsuranceViewSet(GenericViewSet):
         Get all medical insurance constants required for the form.
         Returns a dictionary containing various medical insurance related constants.
         """
-        data = MedicinaAPI().get_all_directories()
+        data = get_directories()
         return Response(data, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        parameters=[DirectoryAutocompleteRequestSerializer],
+        responses={200: DirectoryEntrySerializer(many=True)},
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="autocomplete",
+        serializer_class=DirectoryAutocompleteRequestSerializer,
+        filter_backends=[],
+        pagination_class=None,
+    )
+    def autocomplete(self, request):
+        """
+        Searches the cities and countries of the Donaris directories by name.
+
+        The search runs on an in-process index of the directories snapshot, so only a handful of matches is
+        sent instead of the whole directories, each with the UIN of its region.
+        """
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        entries = get_directory_index().search(
+            serializer.validated_data["q"],
+            kind=serializer.validated_data.get("kind"),
+            limit=serializer.validated_data["limit"],
+        )
+        return Response(DirectoryEntrySerializer(entries, many=True).data, status=status.HTTP_200_OK)
+
     @extend_schema(responses={200: RootReturnSerializer(many=True)})
     @action(
         detail=False,
@@ -442,7 +808,7 @@ class MedicalInsuranceViewSet(GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.validated_data["DogMEDPH"][0]["valiuta_"] = "840"
-        data = MedicinaAPI().calculate_tariff(serializer.validated_data)
+        data = get_medical_tariff(serializer.validated_data)
         medical_insurance_company = MedicalInsuranceCompany.objects.first()
         data["DogMEDPH"][0]["IDNO"] = medical_insurance_company.idno
         data["DogMEDPH"][0]["Name"] = medical_insurance_company.name
@@ -479,81 +845,81 @@ class MedicalInsuranceViewSet(GenericViewSet):
         Returns:
             Response containing the result along with an appropriate HTTP status code.
         """
-        with transaction.atomic():
-            # Validate input data
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-
-            # Handle payment method (either QR code or MAIB payment)
-            if "qrCode" in serializer.validated_data:
-                qr_code = serializer.validated_data.pop("qrCode")
-                qr_code.is_used = True
-                qr_code.save()
-            elif "maibPayment" in serializer.validated_data:
-                maib_payment = serializer.validated_data.pop("maibPayment")
-                maib_payment.is_used = True
-                maib_payment.save()
-
-            serializer.validated_data["DogMEDPH"][0]["valiuta_"] = "840"
-            serializer.validated_data["DogMEDPH"][0]["kontragenti_strakhovatel"] = {
-                "kontragenti_fiskkod": "0200415464644",
-                "naimenovanie": "Blormy Anton",
-                "adres": "str.Stefan cel Mare 1",
-                "nerezident": "da",
-                "datarojdenia": "1985.01.22",
-                "vidcontragenta": "fizicheskoelico",
-                "polnoienaimenovanie": "Blormy Anton S.A.",
-                "vidivzaimootnosheniackontragentom": "fizicheskoelico",
-                "stranakod": "33e8028d-48e6-4621-8c58-744b0ba31526",
-                "gorodkod": "a0ae7112-c0dd-11e4-80c5-0cc47a1e4c62",
-                "Email": "anton@gmail.com",
-                "iuradres": "Chisinau Mesager 4",
-                "pochtadres": "str.Stefan cel Mare 1",
-                "rukovoditel": "Bunescu Alexandru",
-                "dolzhnostrukovoditeljaCod": "3e46cab0-2bf1-11e7-812a-0cc47a1e4c63",
-                "SeriaPasaport": "B",
-                "NumPasaport": "1396825",
-                "CetatenieNonRM": "true",
-                "CFTaraDeOrigine": "",
-                "TaraDeOrigineUIN": "22871557-2350-428c-a23d-ae1906fdf2c9",
-            }
-            serializer.validated_data["DogMEDPH"][0]["kontragenti_kontraktant"] = {
-                "kontragenti_fiskkod": "1236547893021",
-                "naimenovanie": "Brustyn Anton",
-                "nerezident": "da",
-                "datarojdenia": "1985.01.22",
-                "vidcontragenta": "fizicheskoelico",
-                "polnoienaimenovanie": "Brustyn Anton S.A.",
-                "vidivzaimootnosheniackontragentom": "fizicheskoelico",
-                "stranakod": "33e8028d-48e6-4621-8c58-744b0ba31526",
-                "gorodkod": "a0ae7112-c0dd-11e4-80c5-0cc47a1e4c62",
-                "Email": "anton@gmail.com",
-                "iuradres": "Chisinau Mesager 4",
-                "pochtadres": "str.Stefan cel Mare 1",
-                "rukovoditel": "Bunescu Alexandru",
-                "dolzhnostrukovoditeljaCod": "3e46cab0-2bf1-11e7-812a-0cc47a1e4c63",
-                "SeriaPasaport": "B",
-                "NumPasaport": "1396825",
-            }
+        # Validate input data
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        # Claim the payment method (either QR code or MAIB payment)
+        claim = claim_payment(
+            FileTypes.MEDICAL_INSURANCE,
+            qr_code=serializer.validated_data.pop("qrCode", None),
+            maib_payment=serializer.validated_data.pop("maibPayment", None),
+        )
+
+        serializer.validated_data["DogMEDPH"][0]["valiuta_"] = "840"
+        serializer.validated_data["DogMEDPH"][0]["kontragenti_strakhovatel"] = {
+            "kontragenti_fiskkod": "0200415464644",
+            "naimenovanie": "Blormy Anton",
+            "adres": "str.Stefan cel Mare 1",
+            "nerezident": "da",
+            "datarojdenia": "1985.01.22",
+            "vidcontragenta": "fizicheskoelico",
+            "polnoienaimenovanie": "Blormy Anton S.A.",
+            "vidivzaimootnosheniackontragentom": "fizicheskoelico",
+            "stranakod": "33e8028d-48e6-4621-8c58-744b0ba31526",
+            "gorodkod": "a0ae7112-c0dd-11e4-80c5-0cc47a1e4c62",
+            "Email": "anton@gmail.com",
+            "iuradres": "Chisinau Mesager 4",
+            "pochtadres": "str.Stefan cel Mare 1",
+            "rukovoditel": "Bunescu Alexandru",
+            "dolzhnostrukovoditeljaCod": "3e46cab0-2bf1-11e7-812a-0cc47a1e4c63",
+            "SeriaPasaport": "B",
+            "NumPasaport": "1396825",
+            "CetatenieNonRM": "true",
+            "CFTaraDeOrigine": "",
+            "TaraDeOrigineUIN": "22871557-2350-428c-a23d-ae1906fdf2c9",
+        }
+        serializer.validated_data["DogMEDPH"][0]["kontragenti_kontraktant"] = {
+            "kontragenti_fiskkod": "1236547893021",
+            "naimenovanie": "Brustyn Anton",
+            "nerezident": "da",
+            "datarojdenia": "1985.01.22",
+            "vidcontragenta": "fizicheskoelico",
+            "polnoienaimenovanie": "Brustyn Anton S.A.",
+            "vidivzaimootnosheniackontragentom": "fizicheskoelico",
+            "stranakod": "33e8028d-48e6-4621-8c58-744b0ba31526",
+            "gorodkod": "a0ae7112-c0dd-11e4-80c5-0cc47a1e4c62",
+            "Email": "anton@gmail.com",
+            "iuradres": "Chisinau Mesager 4",
+            "pochtadres": "str.Stefan cel Mare 1",
+            "rukovoditel": "Bunescu Alexandru",
+            "dolzhnostrukovoditeljaCod": "3e46cab0-2bf1-11e7-812a-0cc47a1e4c63",
+            "SeriaPasaport": "B",
+            "NumPasaport": "1396825",
+        }
+
+        # Create the contract outside of any transaction, settling the claim if it fails
+        try:
             response_data = MedicinaAPI().create_contract(serializer.validated_data)
-            medical_insurance_company = MedicalInsuranceCompany.objects.first()
-            response_data["DogMEDPH"][0]["IDNO"] = medical_insurance_company.idno
-            response_data["DogMEDPH"][0]["Name"] = medical_insurance_company.name
-            response_data["DogMEDPH"][0]["is_active"] = medical_insurance_company.is_active
-            response_data["DogMEDPH"][0]["logo"] = (
-                medical_insurance_company.logo.url
-                if medical_insurance_company.logo
-                else static("public/default-logo.png")
-            )
+        except Exception as e:
+            settle_failed_claim(claim, e)
+            raise
+        medical_insurance_company = MedicalInsuranceCompany.objects.first()
+        response_data["DogMEDPH"][0]["IDNO"] = medical_insurance_company.idno
+        response_data["DogMEDPH"][0]["Name"] = medical_insurance_company.name
+        response_data["DogMEDPH"][0]["is_active"] = medical_insurance_company.is_active
+        response_data["DogMEDPH"][0]["logo"] = (
+            medical_insurance_company.logo.url if medical_insurance_company.logo else static("public/default-logo.png")
+        )
 
-            document_id = response_data["DogMEDPH"][0]["UIN_Dokumenta"]
-            download_insurance_policy(document_id)
+        document_id = response_data["DogMEDPH"][0]["UIN_Dokumenta"]
+        complete_claim(claim, document_id)
+        download_insurance_policy(document_id)
 
-            return Response(
-                {
-                    "DocumentId": document_id,
-                    "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/",
-                },
-                status=status.HTTP_200_OK,
-            )
+        return Response(
+            {
+                "DocumentId": document_id,
+                "url": f"{settings.CSRF_TRUSTED_ORIGINS[0]}/api/rca/{document_id}/get-rca-file/",
+            },
+            status=status.HTTP_200_OK,
+        )
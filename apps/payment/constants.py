@@ -1,6 +1,11 @@
+from datetime import timedelta
+
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+# Lifetime of a QR code, both locally and at MAIB
+QR_CODE_TTL = timedelta(minutes=15)
+
 
 class QrTypeChoices(models.TextChoices):
     DYNAMIC = "Dynamic", "Dynamic"
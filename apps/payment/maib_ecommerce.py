@@ -1,9 +1,9 @@
-from datetime import datetime, timedelta
-
 import requests
 from django.conf import settings
 from rest_framework.exceptions import AuthenticationFailed
 
+from apps.payment.tokens import maib_ecommerce_token_store
+
 
 class MaibEcommerceService:
     """
@@ -20,15 +20,17 @@ class MaibEcommerceService:
         self.project_id = settings.MAIB_PROJECT_ID
         self.project_secret = settings.MAIB_PROJECT_SECRET
         self.domain = settings.DOMAIN
-        self.token = None
-        self.token_expires_at = datetime.utcnow()
-        self.refresh_token = None
-        self.refresh_token_expires_at = datetime.utcnow()
+        self.session = requests.Session()
 
     def authenticate(self):
         """
         Authenticates with the MAIB E-commerce API using project credentials.
 
+        The tokens are shared by all workers through ``maib_ecommerce_token_store``, so this is only called
+        when neither a valid access token nor a valid refresh token is held by any worker.
+
+        :return: The ``access_token``, ``refresh_token`` and their lifetimes in seconds.
+        :rtype: dict
         :raises AuthenticationFailed: If there is an issue during the API authentication process.
         """
         url = f"{self.base_url}/generate-token"
@@ -37,65 +39,85 @@ class MaibEcommerceService:
             "projectSecret": self.project_secret,
         }
         try:
-            response = requests.post(url, json=payload)
+            response = self.session.post(url, json=payload)
             response.raise_for_status()
             data = response.json()
-
-            if not data.get("ok"):
-                raise AuthenticationFailed("Failed to authenticate with MAIB E-commerce API")
-
-            result = data["result"]
-            self.token = result["accessToken"]
-            self.refresh_token = result["refreshToken"]
-
-            # Set expiration times with 60-second buffer
-            self.token_expires_at = datetime.utcnow() + timedelta(seconds=result["expiresIn"] - 60)
-            self.refresh_token_expires_at = datetime.utcnow() + timedelta(seconds=result["refreshExpiresIn"] - 60)
-
         except requests.exceptions.RequestException as e:
             raise AuthenticationFailed(f"Failed to authenticate with API: {e}") from e
 
-    def refresh_access_token(self):
+        if not data.get("ok"):
+            raise AuthenticationFailed("Failed to authenticate with MAIB E-commerce API")
+
+        result = data["result"]
+        return {
+            "access_token": result["accessToken"],
+            "expires_in": result["expiresIn"],
+            "refresh_token": result["refreshToken"],
+            "refresh_expires_in": result["refreshExpiresIn"],
+        }
+
+    def refresh_access_token(self, refresh_token):
         """
-        Refreshes the access token using the refresh token.
+        Requests a new access token with the refresh token.
 
+        :param refresh_token: The refresh token returned by ``authenticate``.
+        :type refresh_token: str
+        :return: The new ``access_token`` and its lifetime in seconds.
+        :rtype: dict
         :raises AuthenticationFailed: If there is an issue during token refresh.
         """
-        if not self.refresh_token or datetime.utcnow() >= self.refresh_token_expires_at:
-            self.authenticate()
-            return
-
         url = f"{self.base_url}/refresh-token"
-        payload = {"refreshToken": self.refresh_token}
+        payload = {"refreshToken": refresh_token}
         try:
-            response = requests.post(url, json=payload)
+            response = self.session.post(url, json=payload)
             response.raise_for_status()
             data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise AuthenticationFailed(f"Failed to refresh token: {e}") from e
 
-            if not data.get("ok"):
-                raise AuthenticationFailed("Failed to refresh token with MAIB E-commerce API")
+        if not data.get("ok"):
+            raise AuthenticationFailed("Failed to refresh token with MAIB E-commerce API")
 
-            result = data["result"]
-            self.token = result["accessToken"]
-            self.token_expires_at = datetime.utcnow() + timedelta(seconds=result["expiresIn"] - 60)
+        result = data["result"]
+        return {
+            "access_token": result["accessToken"],
+            "expires_in": result["expiresIn"],
+            "refresh_token": result.get("refreshToken"),
+            "refresh_expires_in": result.get("refreshExpiresIn"),
+        }
 
-        except requests.exceptions.RequestException as e:
-            raise AuthenticationFailed(f"Failed to refresh token: {e}") from e
+    def get_token(self):
+        return maib_ecommerce_token_store.get_token(self.authenticate, self.refresh_access_token)
 
     def get_headers(self):
         """
         Generates and retrieves the HTTP headers required for making authenticated requests.
 
+        The access token is taken from ``maib_ecommerce_token_store``, which renews it with the refresh token
+        when it expires.
+
         :return: A dictionary containing the HTTP headers.
         :rtype: dict
         """
-        if not self.token or datetime.utcnow() >= self.token_expires_at:
-            if datetime.utcnow() >= self.refresh_token_expires_at:
-                self.authenticate()
-            else:
-                self.refresh_access_token()
+        return {"Authorization": f"Bearer {self.get_token()}", "Content-Type": "application/json"}
 
-        return {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+    def send(self, method, url, **kwargs):
+        """
+        Sends an authenticated request, renewing the shared token once if the API rejects it.
+
+        :param method: The HTTP method, e.g. ``get``.
+        :type method: str
+        :param url: The URL of the request.
+        :type url: str
+        :return: The response of the API.
+        :rtype: requests.Response
+        """
+        token = self.get_token()
+        response = self.session.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            maib_ecommerce_token_store.invalidate(token)
+            response = self.session.request(method, url, headers=self.get_headers(), **kwargs)
+        return response
 
     def create_payment(self, payment_data):
         """
@@ -108,7 +130,6 @@ class MaibEcommerceService:
         :raises: requests.exceptions.RequestException if the request fails
         """
         url = f"{self.base_url}/pay"
-        headers = self.get_headers()
 
         # Prepare the request data
         request_data = {
@@ -128,7 +149,7 @@ class MaibEcommerceService:
             "failUrl": f"{self.domain}/api/maib/callback",
         }
 
-        response = requests.post(url, json=request_data, headers=headers)
+        response = self.send("post", url, json=request_data)
         response.raise_for_status()
         return response.json()
 
@@ -143,6 +164,6 @@ class MaibEcommerceService:
         :raises: requests.exceptions.RequestException if the request fails
         """
         url = f"{self.base_url}/pay-info/{pay_id}"
-        response = requests.get(url, headers=self.get_headers())
+        response = self.send("get", url)
         response.raise_for_status()
         return response.json()
@@ -1,10 +1,14 @@
-from datetime import datetime, timedelta
+import base64
+import hashlib
+import hmac
 
 import requests
 from django.conf import settings
+from django.utils import timezone
 from rest_framework.exceptions import AuthenticationFailed
 
-from apps.payment.constants import AmountTypeChoices, QrTypeChoices
+from apps.payment.constants import QR_CODE_TTL, AmountTypeChoices, QrTypeChoices
+from apps.payment.tokens import maib_token_store
 
 
 class MaibQrCodeService:
@@ -23,10 +27,8 @@ class MaibQrCodeService:
     :type clientSecret: str
     :ivar domain: Domain of the application for callback and redirect URIs.
     :type domain: str
-    :ivar token: Bearer token for authenticated API calls.
-    :type token: Optional[str]
-    :ivar token_expires_at: The UTC time when the current token expires.
-    :type token_expires_at: datetime
+    :ivar session: HTTP session keeping the connections to the API alive between calls.
+    :type session: requests.Session
     """
 
     def __init__(self):
@@ -34,16 +36,20 @@ class MaibQrCodeService:
         self.clientId = settings.MAIB_CLIENT_ID
         self.clientSecret = settings.MAIB_CLIENT_SECRET
         self.domain = settings.DOMAIN
-        self.token = None
-        self.token_expires_at = datetime.utcnow()
+        self.session = requests.Session()
 
     def authenticate(self):
         """
         Authenticates the client with the API using the provided credentials. This
-        method sends a POST request to the authentication endpoint, retrieves, and
-        stores the access token and its expiration time. If the authentication fails,
-        an exception will be raised.
+        method sends a POST request to the authentication endpoint and returns the
+        access token and its lifetime. If the authentication fails, an exception will
+        be raised.
 
+        The token is shared by all workers through ``maib_token_store``, so this is only
+        called when the shared token is missing or expired.
+
+        :return: The ``access_token`` and its ``expires_in`` seconds.
+        :rtype: dict
         :raises AuthenticationFailed: If there is an issue during the API authentication
             process.
 
@@ -54,12 +60,13 @@ class MaibQrCodeService:
             "clientSecret": self.clientSecret,
         }
         try:
-            response = requests.post(url, json=payload)
+            response = self.session.post(url, json=payload)
             response.raise_for_status()
             data = response.json()
-            self.token = data["result"].get("accessToken")
-            expires_in = data["result"].get("expiresIn", 3600)  # Default to 1 hour
-            self.token_expires_at = datetime.utcnow() + timedelta(seconds=expires_in - 60)
+            return {
+                "access_token": data["result"].get("accessToken"),
+                "expires_in": data["result"].get("expiresIn", 3600),  # Default to 1 hour
+            }
         except requests.exceptions.RequestException as e:
             raise AuthenticationFailed(f"Failed to authenticate with API: {e}") from e
 
@@ -67,16 +74,32 @@ class MaibQrCodeService:
         """
         Generates and retrieves the HTTP headers required for making authenticated requests.
 
-        If the token is expired or missing, the method automatically initiates a new
-        authentication process to update the token before constructing the headers.
+        The token is taken from ``maib_token_store`` and only requested from the API when
+        no worker holds a valid one.
 
         :return: A dictionary containing the HTTP headers, with the `Authorization`
-            field set to the current token and `Content-Type` set to `application/json`.
+            field set to the current token.
         :rtype: dict
         """
-        if not self.token or datetime.utcnow() >= self.token_expires_at:
-            self.authenticate()
-        return {"Authorization": f"Bearer {self.token}"}
+        return {"Authorization": f"Bearer {maib_token_store.get_token(self.authenticate)}"}
+
+    def send(self, method, url, **kwargs):
+        """
+        Sends an authenticated request, renewing the shared token once if the API rejects it.
+
+        :param method: The HTTP method, e.g. ``get``.
+        :type method: str
+        :param url: The URL of the request.
+        :type url: str
+        :return: The response of the API.
+        :rtype: requests.Response
+        """
+        token = maib_token_store.get_token(self.authenticate)
+        response = self.session.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            maib_token_store.invalidate(token)
+            response = self.session.request(method, url, headers=self.get_headers(), **kwargs)
+        return response
 
     def create_qr_code(self, vb_payee_qr_dto, **kwargs):
         """
@@ -96,7 +119,6 @@ class MaibQrCodeService:
         :rtype: dict
         """
         url = f"{self.base_url}/mia/qr"
-        headers = self.get_headers()
 
         # Prepare the request data
         request_data = {
@@ -104,14 +126,15 @@ class MaibQrCodeService:
             "amountType": AmountTypeChoices.FIXED,
             "amount": vb_payee_qr_dto["extension"]["amount"]["sum"],
             "currency": vb_payee_qr_dto["extension"]["amount"]["currency"],
-            "expiresAt": (datetime.now() + timedelta(hours=2, minutes=15)).isoformat(),
+            # Expires at MAIB together with the local QR code, see ``expire_qr_codes``
+            "expiresAt": (timezone.now() + QR_CODE_TTL).isoformat(),
             "order_id": vb_payee_qr_dto["order_id"],
             "description": "Payment www.topasig.md",
             "redirectUrl": f"{self.domain}/payment/success",
             "callbackUrl": f"{self.domain}/payment/callback",
         }
 
-        response = requests.post(url, json=request_data, headers=headers)
+        response = self.send("post", url, json=request_data)
         response.raise_for_status()
         return response.json()
 
@@ -119,9 +142,9 @@ class MaibQrCodeService:
         """
         Retrieves the status of a QR code using its unique identifier.
 
-        This method constructs a URL with the given `qr_header_uuid`,
-        adds any necessary headers using the `get_headers` method, and
-        sends an HTTP GET request to retrieve the QR status. If the request
+        This method constructs a URL with the given `qr_header_uuid` and
+        sends an authenticated HTTP GET request through `send` to retrieve
+        the QR status. If the request
         is unsuccessful, this method will raise an HTTP error. On success,
         it returns the JSON response containing the QR status.
 
@@ -132,6 +155,49 @@ class MaibQrCodeService:
         :raises HTTPError: If the request to the QR status endpoint fails.
         """
         url = f"{self.base_url}/mia/qr/{qr_header_uuid}"
-        response = requests.get(url, headers=self.get_headers())
+        response = self.send("get", url)
         response.raise_for_status()
         return response.json()
+
+    @staticmethod
+    def get_signature(result, signature_key):
+        """
+        Computes the signature of the ``result`` of a MAIB MIA callback.
+
+        The values of ``result`` are sorted by their key (case-insensitive), empty values are skipped and
+        amounts are formatted with two decimals. The values and ``signature_key`` are joined with ``:`` and
+        the SHA-256 digest of that string is encoded in base64.
+
+        :param result: The ``result`` object of the callback payload.
+        :type result: dict
+        :param signature_key: The signature key of the MAIB MIA project.
+        :type signature_key: str
+        :return: The base64 encoded signature.
+        :rtype: str
+        """
+        values = []
+        for _key, value in sorted(result.items(), key=lambda item: item[0].lower()):
+            if value is None or value == "":
+                continue
+            values.append(
+                f"{value:.2f}" if isinstance(value, float | int) and not isinstance(value, bool) else str(value)
+            )
+        values.append(signature_key)
+        return base64.b64encode(hashlib.sha256(":".join(values).encode()).digest()).decode()
+
+    @classmethod
+    def verify_callback(cls, payload):
+        """
+        Checks the signature of a MAIB MIA callback against ``MAIB_SIGNATURE_KEY``.
+
+        Callbacks are always rejected while ``MAIB_SIGNATURE_KEY`` is not configured.
+
+        :param payload: The JSON body of the callback, with ``result`` and ``signature``.
+        :type payload: dict
+        :return: Whether the callback was signed by MAIB.
+        :rtype: bool
+        """
+        result, signature = payload.get("result"), payload.get("signature")
+        if not settings.MAIB_SIGNATURE_KEY or not isinstance(result, dict) or not isinstance(signature, str):
+            return False
+        return hmac.compare_digest(cls.get_signature(result, settings.MAIB_SIGNATURE_KEY), signature)
@@ -1,10 +1,9 @@
-from datetime import datetime, timedelta
-
 import requests
 from django.conf import settings
 from rest_framework.exceptions import AuthenticationFailed, ValidationError
 
 from apps.payment.constants import AmountTypeChoices, PmtContextChoices, QrTypeChoices, UnitsChoices
+from apps.payment.tokens import victoria_token_store
 
 
 class VictoriaQrCodeService:
@@ -24,10 +23,6 @@ class VictoriaQrCodeService:
     :type password: str
     :ivar domain: Domain used for authentication requests.
     :type domain: str
-    :ivar token: JWT token used for authenticated requests.
-    :type token: Optional[str]
-    :ivar token_expires_at: Datetime when the current token will expire.
-    :type token_expires_at: datetime
     """
 
     def __init__(self):
@@ -35,22 +30,21 @@ class VictoriaQrCodeService:
         self.username = settings.VICTORIA_MIA_USERNAME
         self.password = settings.VICTORIA_MIA_PASSWORD
         self.domain = settings.DOMAIN
-        self.token = None
-        self.token_expires_at = datetime.utcnow()
 
     def authenticate(self):
         """
         Authenticate the user by sending credentials to the API and retrieving an
         access token. The function sends a POST request with user credentials to
-        fetch the token and its expiry details, then sets the token and expiration
-        time attributes for subsequent API usage. If an error occurs during the
-        request, an authentication failure exception is raised.
+        fetch the token and its expiry details. The token is shared by all workers
+        through ``victoria_token_store``, so this is only called when no worker holds
+        a valid one. If an error occurs during the request, an authentication failure
+        exception is raised.
 
         Arguments:
             None
 
         Returns:
-            None
+            dict: The ``access_token`` and its ``expires_in`` seconds.
 
         Raises:
             AuthenticationFailed: Raised when the authentication request to the API
@@ -67,19 +61,21 @@ class VictoriaQrCodeService:
             response = requests.post(url, data=payload)
             response.raise_for_status()
             data = response.json()
-            self.token = data.get("accessToken")
-            expires_in = data.get("expiresIn", 3600)  # Default to 1 hour
-            self.token_expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+            return {
+                "access_token": data.get("accessToken"),
+                "expires_in": data.get("expiresIn", 3600),  # Default to 1 hour
+            }
         except requests.exceptions.RequestException as e:
             raise AuthenticationFailed(f"Failed to authenticate with API: {e}") from e
 
     def get_headers(self):
         """
         Get the headers required for API requests, including the Authorization header.
+
+        The token is taken from ``victoria_token_store``.
         """
-        if not self.token or datetime.utcnow() >= self.token_expires_at:
-            self.authenticate()
-        return {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        token = victoria_token_store.get_token(self.authenticate)
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
     def create_qr_code(self, vb_payee_qr_dto, width=300, height=300):
         """
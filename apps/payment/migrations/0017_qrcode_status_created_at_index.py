@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0016_maibpayment_is_used'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qrcode',
+            index=models.Index(fields=['status', 'created_at'], name='payment_qrc_status_61b1c1_idx'),
+        ),
+    ]
@@ -45,6 +45,7 @@ class QrCode(models.Model):
     class Meta:
         verbose_name = _("QR Code")
         verbose_name_plural = _("QR Codes")
+        indexes = [models.Index(fields=["status", "created_at"])]
 
 
 class MaibPayment(models.Model):
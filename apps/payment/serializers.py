@@ -134,3 +134,12 @@ class MaibPaymentCreateSerializer(serializers.Serializer):
     )
     description = serializers.CharField(max_length=124, required=False, allow_null=True)
     items = serializers.ListField(child=MaibPaymentItemSerializer(), required=True, allow_null=False)
+
+
+class MiaCallbackSerializer(serializers.Serializer):
+    """
+    The ``result`` of a MAIB MIA callback, other fields of the payload are ignored.
+    """
+
+    qrId = serializers.UUIDField()  # noqa: N815
+    qrStatus = serializers.ChoiceField(choices=StatusChoices.choices)  # noqa: N815
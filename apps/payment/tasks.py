@@ -1,51 +1,110 @@
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
 from celery import shared_task
 from django.conf import settings
-from django.db import transaction
 from django.utils import timezone
 
-from apps.payment.constants import MaibPaymentStatus, StatusChoices
+from apps.common.cache import cache_lock
+from apps.payment.constants import QR_CODE_TTL, MaibPaymentStatus, StatusChoices
 from apps.payment.maib_ecommerce import MaibEcommerceService
 from apps.payment.mia_maib import MaibQrCodeService
 from apps.payment.models import MaibPayment, QrCode
 
+# MAIB pay-info statuses of payments that are not final yet
+MAIB_PENDING_STATUSES = ("CREATED", "PENDING")
+
+# (maximum age, check interval) of pending e-commerce payments, checked in order
+PAYMENT_CHECK_BACKOFF = (
+    (timedelta(minutes=10), timedelta(minutes=1)),
+    (timedelta(hours=1), timedelta(minutes=5)),
+    (timedelta(hours=6), timedelta(minutes=30)),
+    (timedelta(days=1), timedelta(hours=2)),
+)
+
+
+def expire_qr_codes() -> int:
+    """
+    Marks the active QR codes older than ``QR_CODE_TTL`` as expired in one ``UPDATE``, without asking MAIB.
+
+    Returns:
+        int: The number of expired QR codes.
+    """
+    now = timezone.now()
+    return QrCode.objects.filter(status=StatusChoices.ACTIVE, created_at__lt=now - QR_CODE_TTL).update(
+        status=StatusChoices.EXPIRED, updated_at=now
+    )
+
+
+def get_qr_statuses(qr_codes: list[QrCode]) -> tuple[dict, list]:
+    """
+    Fetches the MAIB status of the QR codes concurrently over one authenticated session.
+
+    Parameters:
+        qr_codes (list[QrCode]): The QR codes to check.
+
+    Returns:
+        tuple[dict, list]: The MAIB status by QR code and the QR codes whose status could not be fetched.
+    """
+    qrcode_service = MaibQrCodeService()
+    # Authenticate once before the threads share the token
+    qrcode_service.get_headers()
+
+    def get_status(qr):
+        return qrcode_service.get_qr_status(str(qr.uuid))["result"].get("status")
+
+    statuses, failed = {}, []
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_SWEEP_MAX_WORKERS) as executor:
+        futures = {executor.submit(get_status, qr): qr for qr in qr_codes}
+        for future in as_completed(futures):
+            try:
+                statuses[futures[future]] = future.result()
+            except Exception:  # noqa BLE001
+                failed.append(futures[future])
+    return statuses, failed
+
 
 @shared_task
 def update_qr_status():
-    queryset = QrCode.objects.filter(status=StatusChoices.ACTIVE)
-
-    data = {
-        "updated": [],
-        "failed": [],
-        "not_changed": [],
-    }
-
-    for qr in queryset:
-        qrcode_service = MaibQrCodeService()
-        try:
-            with transaction.atomic():
-                response_data = qrcode_service.get_qr_status(str(qr.uuid))
-                # Update the status of the QR code in the database
-                status = response_data["result"].get("status")
-                if status and status != qr.status:
-                    qr.status = status
-                    qr.save()
-                    data["updated"].append(qr.pk)
-                elif qr.created_at + timedelta(minutes=15) < timezone.now():
-                    qr.status = StatusChoices.EXPIRED
-                    qr.save()
-                    data["updated"].append(qr.pk)
-                else:
-                    data["not_changed"].append(qr.pk)
-        except Exception:  # noqa BLE001
-            data["failed"].append(qr.pk)
-            if qr.created_at + timedelta(minutes=15) < timezone.now():
-                qr.status = StatusChoices.EXPIRED
-                qr.save()
-                data["updated"].append(qr.pk)
-
-    return data
+    """
+    Sweeps the active QR codes and stores the statuses reported by MAIB.
+
+    QR codes past their TTL are expired first with a single SQL ``UPDATE``, so only the QR codes that can
+    still be paid are polled. Statuses are fetched concurrently (``PAYMENT_SWEEP_MAX_WORKERS`` calls at a
+    time) and the changed QR codes are written back with a single ``bulk_update``, restricted to the rows
+    that are still active. A cache lock keeps a slow run from overlapping the next beat run.
+    """
+    with cache_lock(
+        "payment:update-qr-status", timeout=settings.PAYMENT_SWEEP_LOCK_TIMEOUT, blocking_timeout=0
+    ) as acquired:
+        if not acquired:
+            return {"skipped": True}
+
+        expired = expire_qr_codes()
+        qr_codes = list(QrCode.objects.filter(status=StatusChoices.ACTIVE))
+        if not qr_codes:
+            return {"expired": expired, "updated": [], "failed": [], "not_changed": []}
+
+        statuses, failed = get_qr_statuses(qr_codes)
+        now = timezone.now()
+        changed = []
+        for qr in qr_codes:
+            status = statuses.get(qr)
+            if status and status != qr.status:
+                qr.status = status
+                qr.updated_at = now
+                changed.append(qr)
+
+        # Rows paid or cancelled by a request in the meantime are left untouched
+        QrCode.objects.filter(status=StatusChoices.ACTIVE).bulk_update(changed, ["status", "updated_at"])
+
+        changed_pks = {qr.pk for qr in changed}
+        return {
+            "expired": expired,
+            "updated": sorted(changed_pks),
+            "failed": [qr.pk for qr in failed],
+            "not_changed": [qr.pk for qr in qr_codes if qr.pk not in changed_pks],
+        }
 
 
 @shared_task
@@ -54,51 +113,129 @@ def update_qr_status_if_debug(qr: str):
         QrCode.objects.filter(status=StatusChoices.ACTIVE, uuid=qr).update(status=StatusChoices.PAID)
 
 
-@shared_task
-def check_payment_status(pay_id):
+def apply_payment_result(payment: MaibPayment, result: dict, now) -> None:
     """
-    Checks the status of a MAIB payment and updates it in the database.
+    Copies the ``pay-info`` result of MAIB onto the payment, without saving it.
 
-    Args:
-        pay_id (str): The MAIB payment ID to check
+    Payments still being processed by MAIB (``CREATED`` or ``PENDING``) stay pending.
     """
-    try:
-        payment = MaibPayment.objects.get(pay_id=pay_id)
+    if result["status"] == MaibPaymentStatus.SUCCESS:
+        payment.status = MaibPaymentStatus.SUCCESS
+    elif result["status"] not in MAIB_PENDING_STATUSES:
+        payment.status = MaibPaymentStatus.FAILED
+
+    payment.data.update(
+        {
+            "status_code": result.get("statusCode"),
+            "status_message": result.get("statusMessage"),
+            "three_ds": result.get("threeDs"),
+            "rrn": result.get("rrn"),
+            "approval": result.get("approval"),
+            "card_number": result.get("cardNumber"),
+            "last_check": now.isoformat(),
+        }
+    )
+    payment.updated_at = now
+
+
+def get_check_interval(age: timedelta) -> timedelta:
+    """
+    Returns how often a pending payment of the given age is checked: young payments every run, then less and
+    less often as they are probably abandoned.
+    """
+    for max_age, interval in PAYMENT_CHECK_BACKOFF:
+        if age < max_age:
+            return interval
+    return PAYMENT_CHECK_BACKOFF[-1][1]
 
-        # Skip if payment is already in final state
-        if payment.status in [MaibPaymentStatus.SUCCESS, MaibPaymentStatus.FAILED]:
-            return
 
-        # Initialize MAIB E-commerce service
-        maib_service = MaibEcommerceService()
+def is_payment_due(payment: MaibPayment, now) -> bool:
+    last_check = payment.data.get("last_check")
+    if not last_check:
+        return True
+    return now - datetime.fromisoformat(last_check) >= get_check_interval(now - payment.created_at)
 
-        # Get payment status from MAIB
-        response = maib_service.get_payment_status(pay_id)
 
-        if not response.get("ok"):
-            return
+@shared_task
+def check_pending_payments():
+    """
+    Sweeps the pending MAIB e-commerce payments created within ``PAYMENT_PENDING_WINDOW`` seconds.
 
-        result = response["result"]
+    Each payment is checked according to its age (see ``PAYMENT_CHECK_BACKOFF``), ``pay-info`` is queried
+    concurrently over one MAIB token and the results are written back with a single ``bulk_update``,
+    restricted to the payments that are still pending. A cache lock keeps runs from overlapping.
+    """
+    with cache_lock(
+        "payment:check-pending-payments", timeout=settings.PAYMENT_SWEEP_LOCK_TIMEOUT, blocking_timeout=0
+    ) as acquired:
+        if not acquired:
+            return {"skipped": True}
+
+        now = timezone.now()
+        payments = [
+            payment
+            for payment in MaibPayment.objects.filter(
+                status=MaibPaymentStatus.PENDING,
+                created_at__gte=now - timedelta(seconds=settings.PAYMENT_PENDING_WINDOW),
+            ).exclude(pay_id="")
+            if is_payment_due(payment, now)
+        ]
+        if not payments:
+            return {"checked": 0, "updated": [], "failed": []}
 
-        # Update payment status
-        payment.status = (
-            MaibPaymentStatus.SUCCESS if result["status"] == MaibPaymentStatus.SUCCESS else MaibPaymentStatus.FAILED
-        )
+        maib_service = MaibEcommerceService()
+        # Authenticate once before the threads share the token
+        maib_service.get_headers()
 
-        # Update payment data
-        payment.data.update(
-            {
-                "status_code": result["statusCode"],
-                "status_message": result["statusMessage"],
-                "three_ds": result.get("threeDs"),
-                "rrn": result.get("rrn"),
-                "approval": result.get("approval"),
-                "card_number": result.get("cardNumber"),
-                "last_check": timezone.now().isoformat(),
+        checked, failed = [], []
+        with ThreadPoolExecutor(max_workers=settings.PAYMENT_SWEEP_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(maib_service.get_payment_status, payment.pay_id): payment for payment in payments
             }
+            for future in as_completed(futures):
+                payment = futures[future]
+                try:
+                    response = future.result()
+                except Exception:  # noqa BLE001
+                    failed.append(payment.pk)
+                    continue
+                if not response.get("ok"):
+                    failed.append(payment.pk)
+                    continue
+                apply_payment_result(payment, response["result"], now)
+                checked.append(payment)
+
+        # Payments confirmed by the callback in the meantime are left untouched
+        MaibPayment.objects.filter(status=MaibPaymentStatus.PENDING).bulk_update(
+            checked, ["status", "data", "updated_at"]
         )
+        return {
+            "checked": len(checked),
+            "updated": sorted(payment.pk for payment in checked if payment.status != MaibPaymentStatus.PENDING),
+            "failed": failed,
+        }
 
-        payment.save()
 
+@shared_task
+def check_payment_status(pay_id):
+    """
+    Checks the status of a MAIB payment and updates it in the database.
+
+    Args:
+        pay_id (str): The MAIB payment ID to check
+    """
+    try:
+        payment = MaibPayment.objects.get(pay_id=pay_id)
     except MaibPayment.DoesNotExist:
-        pass
+        return
+
+    # Skip if payment is already in final state
+    if payment.status != MaibPaymentStatus.PENDING:
+        return
+
+    response = MaibEcommerceService().get_payment_status(pay_id)
+    if not response.get("ok"):
+        return
+
+    apply_payment_result(payment, response["result"], timezone.now())
+    payment.save()
@@ -0,0 +1,98 @@
+import time
+from collections.abc import Callable
+
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.common.cache import cache_lock
+
+# Seconds before the reported expiry at which a token is no longer handed out
+EXPIRY_MARGIN = 60
+
+
+class OAuthTokenStore:
+    """
+    Shares the OAuth access token of a payment API between all gunicorn and Celery workers.
+
+    The token is kept in the default cache with its expiry, so a new client instance does not authenticate
+    again while the token is valid. An expired token is renewed by a single worker at a time, with its
+    refresh token when the API has one and it is still valid, otherwise with the client credentials.
+
+    The ``authenticate`` and ``refresh`` callables of ``get_token`` return a dictionary with ``access_token``
+    and ``expires_in`` and, optionally, ``refresh_token`` and ``refresh_expires_in``.
+    """
+
+    def __init__(self, name: str, lock_timeout: int = 30):
+        self.name = name
+        self.lock_timeout = lock_timeout
+
+    def get_cache_key(self) -> str:
+        return f"payment:token:{self.name}"
+
+    def get_token(self, authenticate: Callable[[], dict], refresh: Callable[[str], dict] | None = None) -> str:
+        """
+        Returns the shared access token, renewing it if it is missing or about to expire.
+
+        Parameters:
+            authenticate (Callable): Requests a new token with the client credentials.
+            refresh (Callable | None): Requests a new token with the given refresh token.
+
+        Returns:
+            str: The access token.
+        """
+        entry = cache.get(self.get_cache_key())
+        if entry and entry["expires_at"] > time.time():
+            return entry["access_token"]
+
+        with cache_lock(f"{self.get_cache_key()}:lock", timeout=self.lock_timeout, blocking_timeout=self.lock_timeout):
+            # Another worker may have renewed the token while waiting for the lock
+            entry = cache.get(self.get_cache_key())
+            if entry and entry["expires_at"] > time.time():
+                return entry["access_token"]
+            return self.renew(entry, authenticate, refresh)["access_token"]
+
+    def renew(
+        self, entry: dict | None, authenticate: Callable[[], dict], refresh: Callable[[str], dict] | None
+    ) -> dict:
+        data = None
+        if refresh and entry and entry.get("refresh_token") and entry["refresh_expires_at"] > time.time():
+            try:
+                data = refresh(entry["refresh_token"])
+            except AuthenticationFailed:
+                data = None
+        if data is None:
+            data = authenticate()
+
+        now = time.time()
+        entry = {
+            "access_token": data["access_token"],
+            "expires_at": now + data["expires_in"] - EXPIRY_MARGIN,
+            # A refreshed token keeps the refresh token it was obtained with
+            "refresh_token": data.get("refresh_token") or (entry or {}).get("refresh_token"),
+            "refresh_expires_at": (
+                now + data["refresh_expires_in"] - EXPIRY_MARGIN
+                if data.get("refresh_expires_in")
+                else (entry or {}).get("refresh_expires_at", 0)
+            ),
+        }
+        timeout = max(entry["expires_at"], entry["refresh_expires_at"]) - now
+        if timeout > 0:
+            cache.set(self.get_cache_key(), entry, int(timeout))
+        return entry
+
+    def invalidate(self, token: str) -> None:
+        """
+        Drops ``token`` from the cache unless another worker has already replaced it, e.g. after the API
+        rejected it.
+
+        The refresh token is kept, so the next caller can still use it.
+        """
+        entry = cache.get(self.get_cache_key())
+        if entry and entry["access_token"] == token:
+            timeout = max(int(entry["refresh_expires_at"] - time.time()), 1)
+            cache.set(self.get_cache_key(), {**entry, "expires_at": 0}, timeout)
+
+
+maib_token_store = OAuthTokenStore("maib-mia")
+maib_ecommerce_token_store = OAuthTokenStore("maib-ecommerce")
+victoria_token_store = OAuthTokenStore("victoria-mia")
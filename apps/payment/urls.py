@@ -7,4 +7,7 @@ router = DefaultRouter()
 router.register(r"qr", QrCodeViewSet, basename="qr-code")
 router.register(r"maib", MaibPaymentViewSet, basename="maib-payment")
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    path("payment/callback", QrCodeViewSet.as_view({"post": "callback"}), name="qr-code-callback"),
+    path("", include(router.urls)),
+]
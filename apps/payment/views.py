@@ -5,6 +5,7 @@ from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import transaction
 from django.http import HttpResponse
+from django.utils import timezone
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema
 from PIL import Image
@@ -23,6 +24,7 @@ from apps.payment.models import MaibPayment, QrCode
 from apps.payment.serializers import (
     MaibPaymentCreateSerializer,
     MaibPaymentSerializer,
+    MiaCallbackSerializer,
     QrCodeSerializer,
     SizeSerializer,
     VbPayeeQrDtoSerializer,
@@ -171,6 +173,11 @@ class QrCodeViewSet(GenericViewSet):
                 the external service.
         """
         instance = get_object_or_404(QrCode, uuid=uuid)
+        # Final statuses are pushed by the MAIB callback, there is nothing left to ask MAIB. QR codes expired
+        # locally are still checked, MAIB may have accepted a payment the callback of which was missed.
+        if instance.status not in (StatusChoices.ACTIVE, StatusChoices.EXPIRED):
+            return Response(QrCodeSerializer(instance).data)
+
         qrcode_service = MaibQrCodeService()
         response_data = qrcode_service.get_qr_status(uuid)
 
@@ -183,6 +190,37 @@ class QrCodeViewSet(GenericViewSet):
             instance.save()
         return Response(QrCodeSerializer(instance).data)
 
+    @extend_schema(request=MiaCallbackSerializer, responses={200: None})
+    def callback(self, request):
+        """
+        Handles the MAIB MIA callback sent when the status of a QR code changes (``{DOMAIN}/payment/callback``).
+
+        The signature of the payload is verified with ``MAIB_SIGNATURE_KEY`` and the status of the QR code is
+        stored right away, so the payment is confirmed without waiting for the ``update_qr_status`` sweep.
+        Only active QR codes are updated, so replayed or late callbacks never change a final status, except for
+        a ``Paid`` callback on a QR code that was expired locally: the customer has paid and the payment wins.
+
+        Parameters:
+            request (HttpRequest): The HTTP request with the ``result`` and ``signature`` of the callback.
+
+        Returns:
+            Response: 200 once the callback is processed, 400 if the payload is invalid or 403 if its signature
+                does not match.
+        """
+        if not MaibQrCodeService.verify_callback(request.data):
+            return Response({"detail": "Invalid signature."}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = MiaCallbackSerializer(data=request.data["result"])
+        serializer.is_valid(raise_exception=True)
+        qr_status = serializer.validated_data["qrStatus"]
+        updatable = [StatusChoices.ACTIVE]
+        if qr_status == StatusChoices.PAID:
+            updatable.append(StatusChoices.EXPIRED)
+        QrCode.objects.filter(uuid=serializer.validated_data["qrId"], status__in=updatable).exclude(
+            status=qr_status
+        ).update(status=qr_status, updated_at=timezone.now())
+        return Response(status=status.HTTP_200_OK)
+
 
 class MaibPaymentViewSet(GenericViewSet):
     queryset = MaibPayment.objects.all()
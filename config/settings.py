@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 
 import environ
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext_lazy as _
 
 # Initialize environment variables
@@ -131,6 +132,24 @@ DATABASES = {
 }
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 100000000  # 100 MB
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# The cache holds state shared by the web and Celery processes (security tokens, locks, document build
+# status), so it must be Redis outside development. Defaults to the Celery broker when it is Redis.
+REDIS_URL = env.str("REDIS_URL", default="")
+if not REDIS_URL and env.str("CELERY_BROKER_URL", default="").startswith(("redis://", "rediss://")):
+    REDIS_URL = env.str("CELERY_BROKER_URL")
+if not REDIS_URL and not DEBUG:
+    raise ImproperlyConfigured("REDIS_URL must be set: a per-process cache breaks the locks and shared tokens.")
+CACHES = {
+    "default": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}
+        if REDIS_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -201,6 +220,29 @@ SPECTACULAR_SETTINGS = {
 RCA_USERNAME = env.str("RCA_USERNAME")
 RCA_PASSWORD = env.str("RCA_PASSWORD")
 RCA_URL = env.str("RCA_URL", default="https://rcaapi-test.bnm.md/RcaExportService.asmx?WSDL")
+RCA_WSDL_PATH = env.str(
+    "RCA_WSDL_PATH", default=(BASE_DIR / "apps" / "ensurance" / "wsdl" / "RcaExportService.wsdl").as_posix()
+)
+RCA_WSDL_CACHE_PATH = env.str("RCA_WSDL_CACHE_PATH", default=(BASE_DIR / ".zeep_cache.db").as_posix())
+RCA_WSDL_CACHE_TIMEOUT = env.int("RCA_WSDL_CACHE_TIMEOUT", default=24 * 60 * 60)  # 1 day
+RCA_SECURITY_TOKEN_TTL = env.int("RCA_SECURITY_TOKEN_TTL", default=15 * 60)  # 15 minutes
+RCA_QUOTE_CACHE_TTL = env.int("RCA_QUOTE_CACHE_TTL", default=10 * 60)  # 10 minutes
+RCA_QUOTE_ERROR_CACHE_TTL = env.int("RCA_QUOTE_ERROR_CACHE_TTL", default=60)  # 1 minute
+MEDICAL_TARIFF_CACHE_TTL = env.int("MEDICAL_TARIFF_CACHE_TTL", default=5 * 60)  # 5 minutes
+MEDICAL_TARIFF_ERROR_CACHE_TTL = env.int("MEDICAL_TARIFF_ERROR_CACHE_TTL", default=60)  # 1 minute
+RCA_QUOTE_MAX_WORKERS = env.int("RCA_QUOTE_MAX_WORKERS", default=8)
+RCA_DOCUMENT_STATUS_TTL = env.int("RCA_DOCUMENT_STATUS_TTL", default=24 * 60 * 60)  # 1 day
+RCA_DOCUMENT_WAIT_TIMEOUT = env.int("RCA_DOCUMENT_WAIT_TIMEOUT", default=5)  # 5 seconds
+RCA_DOCUMENT_BUILD_TIMEOUT = env.int("RCA_DOCUMENT_BUILD_TIMEOUT", default=2 * 60)  # 2 minutes
+PAYMENT_CLAIM_TIMEOUT = env.int("PAYMENT_CLAIM_TIMEOUT", default=10 * 60)  # 10 minutes
+PAYMENT_SWEEP_MAX_WORKERS = env.int("PAYMENT_SWEEP_MAX_WORKERS", default=8)
+PAYMENT_SWEEP_LOCK_TIMEOUT = env.int("PAYMENT_SWEEP_LOCK_TIMEOUT", default=5 * 60)  # 5 minutes
+PAYMENT_PENDING_WINDOW = env.int("PAYMENT_PENDING_WINDOW", default=24 * 60 * 60)  # 1 day
+DOCUMENT_DELIVERY_MODE = env.str("DOCUMENT_DELIVERY_MODE", default="stream")  # "stream" or "redirect"
+DOCUMENT_URL_EXPIRY = env.int("DOCUMENT_URL_EXPIRY", default=5 * 60)  # 5 minutes
+PDF_MERGE_GARBAGE = env.int("PDF_MERGE_GARBAGE", default=3)  # PyMuPDF garbage collection level, 0 disables it
+PDF_STAMP_PATH = env.str("PDF_STAMP_PATH", default=(BASE_DIR / "stamp.png").as_posix())
+PDF_STAMP_DOCUMENTS = env.bool("PDF_STAMP_DOCUMENTS", default=False)
 
 # Locales
 DEFAULT_LANG = "en"
@@ -226,6 +268,7 @@ VICTORIA_MIA_PASSWORD = env.str("VICTORIA_MIA_PASSWORD", "")
 MAIB_MIA_BASE_URL = env.str("MAIB_MIA_BASE_URL")
 MAIB_CLIENT_ID = env.str("MAIB_CLIENT_ID")
 MAIB_CLIENT_SECRET = env.str("MAIB_CLIENT_SECRET")
+MAIB_SIGNATURE_KEY = env.str("MAIB_SIGNATURE_KEY", default="")
 
 # MAIB E-commerce settings
 MAIB_PROJECT_ID = env("MAIB_PROJECT_ID", default="")
@@ -252,12 +295,26 @@ CELERY_RESULT_BACKEND = "django-db"
 CELERY_BEAT_SCHEDULE = {
     "update_qr_status": {
         "task": "apps.payment.tasks.update_qr_status",
-        "schedule": 3 * 60,  # 3 minutes
+        # Safety net for missed callbacks, statuses are pushed to payment/callback
+        "schedule": 10 * 60,  # 10 minutes
     },
-    "check_payment_status": {
-        "task": "apps.payment.tasks.check_payment_status",
+    "check_pending_payments": {
+        "task": "apps.payment.tasks.check_pending_payments",
         "schedule": 1 * 60,  # 1 minute
     },
+    "refresh_medicina_directories": {
+        "task": "apps.ensurance.tasks.refresh_medicina_directories",
+        "schedule": 30 * 60,  # 30 minutes
+    },
+    "send_queued_emails": {
+        # Retries deferred emails, new emails schedule their own batch
+        "task": "apps.ensurance.tasks.send_queued_emails",
+        "schedule": 1 * 60,  # 1 minute
+    },
+    "recover_payment_claims": {
+        "task": "apps.ensurance.tasks.recover_payment_claims",
+        "schedule": 5 * 60,  # 5 minutes
+    },
 }
 
 # Minio
@@ -293,6 +350,11 @@ EMAIL_USE_SSL = env.bool("EMAIL_USE_SSL", default=True)
 EMAIL_HOST_USER = env.str("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = env.str("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL = env.str("DEFAULT_FROM_EMAIL", default=EMAIL_HOST_USER)
+EMAIL_CONNECTION_MAX_IDLE = env.int("EMAIL_CONNECTION_MAX_IDLE", default=60)  # 1 minute
+EMAIL_BATCH_SIZE = env.int("EMAIL_BATCH_SIZE", default=50)
+EMAIL_BATCH_DELAY = env.int("EMAIL_BATCH_DELAY", default=5)  # 5 seconds
+EMAIL_MAX_ATTEMPTS = env.int("EMAIL_MAX_ATTEMPTS", default=5)
+EMAIL_FILE_LINK_MAX_AGE = env.int("EMAIL_FILE_LINK_MAX_AGE", default=7 * 24 * 60 * 60)  # 1 week
 
 # Logging
 DRF_API_LOGGER_DATABASE = True
@@ -324,3 +386,4 @@ JAZZMIN_SETTINGS = {
 DONARIS_BASE_URL = env.str("DONARIS_BASE_URL", default="")
 DONARIS_USERNAME = env.str("DONARIS_USERNAME")
 DONARIS_PASSWORD = env.str("DONARIS_PASSWORD")
+DONARIS_DIRECTORIES_TTL = env.int("DONARIS_DIRECTORIES_TTL", default=60 * 60)  # 1 hour
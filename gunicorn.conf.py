@@ -1,6 +1,8 @@
 import os
 
-wsgi_app = "config.wsgi:application"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+# Async workers (e.g. uvicorn.workers.UvicornWorker) serve the ASGI application so async views can await upstream calls
+wsgi_app = "config.asgi:application" if worker_class.startswith("uvicorn") else "config.wsgi:application"
 bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
 workers = os.getenv("GUNICORN_WORKERS", 4)
 workers_connections = os.getenv("GUNICORN_WORKERS_CONNECTIONS", 1001)